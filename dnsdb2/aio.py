@@ -0,0 +1,238 @@
+# Copyright (c) 2020 by Farsight Security, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# An asyncio client for DNSDB protocol version 2 with Flex Search. Requires
+# aiohttp.
+#
+# Example:
+#     async with dnsdb2.aio.AsyncClient(apikey) as c:
+#         try:
+#             async for result in c.flex_rrnames_regex(r'\._dkim\.', limit=1):
+#                 # do something with result
+#         except dnsdb2.QueryLimited:
+#             # log that the query was limited, or re-issue with the next
+#             # offset
+
+import asyncio
+import urllib.parse
+from typing import Dict
+
+try:
+    import orjson as json
+except ImportError:
+    import json
+
+import aiohttp
+
+import dnsdb2
+import dnsdb2.saf
+from dnsdb2.client import (
+    API_PREFIX, ACCEPT_CONTENT_TYPE, DEFAULT_DNSDB_SERVER, DEFAULT_POOL_MAXSIZE, DEFAULT_SWCLIENT, DEFAULT_VERSION,
+    _ERROR_BODY_MAX, _STATUS_CODE_MAP, _gen_rrset, _gen_rdata_name, _gen_rdata_ip, _gen_rdata_raw, _gen_flex,
+)
+
+
+class AsyncClient(object):
+    """
+    An asyncio client for DNSDB protocol version 2 with Flex Search.
+
+    The lookup, summarize, and flex methods return async iterators of results.
+
+    Example:
+        async with dnsdb2.aio.AsyncClient(apikey, swclient="yourappname", version="v0.0") as c:
+            try:
+                async for result in c.flex_rrnames_regex(r'\\._dkim\\.', limit=1):
+                    # do something with result
+            except dnsdb2.QueryLimited:
+                # log that the query was limited, or re-issue with the next offset
+    """
+    def __init__(self, apikey: str, server: str = DEFAULT_DNSDB_SERVER,
+                 swclient: str = DEFAULT_SWCLIENT, version: str = DEFAULT_VERSION,
+                 proxies: Dict[str, str] = None, insecure: bool = False,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE):
+        """
+        Args:
+            apikey (str): A DNSDB API key
+            server (str): The DNSDB API server endpoint
+            swclient (str): The name of the client software reported to DNSDB.
+            version (str): The version of the software reported to DNSDB.
+            proxies (Dict[str, str]): HTTP proxies to use. Mapping of protocol to URL.
+            insecure (bool): Skip https validation.
+            pool_maxsize (int): Maximum number of concurrent connections to
+                the server.
+        """
+        self.apikey = apikey
+        self.server = server
+        self.swclient = swclient
+        self.version = version
+        self.proxies = proxies
+        self.insecure = insecure
+        self.pool_maxsize = pool_maxsize
+        self._session = None
+
+        self._url_base = f'{server}/{API_PREFIX}'
+        self._headers_cached = {
+            'Accept': ACCEPT_CONTENT_TYPE,
+            'X-Api-Key': apikey,
+        }
+        self._base_params_cached = {
+            'swclient': swclient,
+            'version': version,
+        }
+        self._proxy = (proxies or {}).get(urllib.parse.urlsplit(server).scheme)
+
+    async def close(self) -> None:
+        """
+        Releases resources allocated by the AsyncClient.
+        """
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    lookup_rrset = _gen_rrset('lookup')
+    summarize_rrset = _gen_rrset('summarize')
+    lookup_rdata_name = _gen_rdata_name('lookup')
+    summarize_rdata_name = _gen_rdata_name('summarize')
+    lookup_rdata_ip = _gen_rdata_ip('lookup')
+    summarize_rdata_ip = _gen_rdata_ip('summarize')
+    lookup_rdata_raw = _gen_rdata_raw('lookup')
+    summarize_rdata_raw = _gen_rdata_raw('summarize')
+    flex_rrnames_regex = _gen_flex('regex', 'rrnames')
+    flex_rrnames_glob = _gen_flex('glob', 'rrnames')
+    flex_rdata_regex = _gen_flex('regex', 'rdata')
+    flex_rdata_glob = _gen_flex('glob', 'rdata')
+
+    async def ping(self) -> bool:
+        """
+        Tests end to end connectivity tests to the DNSDB API endpoint, letting
+        you know that there are no firewall blockages.
+        """
+        path = 'ping'
+        return (await self._json_query(path)).get('ping') == 'ok'
+
+    async def rate_limit(self) -> dict:
+        """
+        Retrieves quota information as described in the DNSDB API v2 documentation.
+        """
+        path = 'rate_limit'
+        return await self._json_query(path)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # The session must be created from within a running event loop.
+        if self._session is None:
+            # Like the Client, queries are not limited in time. aiohttp's
+            # default would cut off long running streamed lookups.
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.pool_maxsize, ssl=not self.insecure),
+                timeout=aiohttp.ClientTimeout(total=None),
+            )
+        return self._session
+
+    def _query_params(self, params: dict) -> dict:
+        # aiohttp rejects bool and None values, requests formats bools with
+        # str() and drops Nones.
+        query_params = dict(self._base_params_cached)
+        for k, v in params.items():
+            if v is None:
+                continue
+            query_params[k] = str(v) if isinstance(v, bool) else v
+        return query_params
+
+    async def _get(self, path: str, params: dict) -> aiohttp.ClientResponse:
+        res = await self._get_session().get(
+            f'{self._url_base}/{path}',
+            params=self._query_params(params),
+            headers=self._headers_cached,
+            proxy=self._proxy,
+        )
+        try:
+            await _raise_error(res)
+        except BaseException:
+            res.release()
+            raise
+        return res
+
+    async def _json_query(self, path: str, **params):
+        try:
+            async with await self._get(path, params) as res:
+                return json.loads(await res.read())
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            raise dnsdb2.QueryError from e
+
+    async def _saf_query(self, path: str, ignore_limited: bool = False, cache: bool = False, **params):
+        # The AsyncClient does not cache results, cache is accepted for
+        # compatibility with the Client and is not sent to the server.
+        try:
+            res = await self._get(path, params)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise dnsdb2.QueryError from e
+
+        async for obj in _handle_saf(res, ignore_limited=ignore_limited):
+            yield obj
+
+
+async def _raise_error(res: aiohttp.ClientResponse) -> None:
+    status = res.status
+    if 200 <= status < 300:
+        return
+    e = _STATUS_CODE_MAP.get(status)
+    if e:
+        # A read may return less than requested, read until the limit or EOF.
+        body = bytearray()
+        while len(body) < _ERROR_BODY_MAX:
+            data = await res.content.read(_ERROR_BODY_MAX - len(body))
+            if not data:
+                break
+            body += data
+        raise e(body.decode('utf-8', 'replace'))
+    res.raise_for_status()
+
+
+async def _iter_ndjson(res: aiohttp.ClientResponse, chunk: int = dnsdb2.saf._CHUNK_SIZE):
+    pending = bytearray()
+    async for data in res.content.iter_chunked(chunk):
+        pending += data
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if line:
+                yield line
+    if pending:
+        yield pending
+
+
+async def _handle_saf(res: aiohttp.ClientResponse, ignore_limited: bool = False):
+    try:
+        async for line in _iter_ndjson(res):
+            obj, exc = dnsdb2.saf._handle_line(line)
+            if obj:
+                yield obj
+            if exc is None:
+                continue
+            # StopIteration can not be raised from an async generator.
+            if isinstance(exc, StopIteration) or ignore_limited and isinstance(exc, dnsdb2.QueryLimited):
+                return
+            raise exc
+
+        raise dnsdb2.QueryTruncated()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise dnsdb2.QueryError from e
+    finally:
+        res.release()
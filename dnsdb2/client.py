@@ -23,11 +23,24 @@
 #            # log that the query was limited, or re-issue with the next
 #            # offset
 
+import copy
+import functools
 import http
+import threading
 import urllib.parse
-from typing import Dict
-
+from typing import Dict, Iterable
+
+try:
+    import cachetools
+except ImportError:
+    cachetools = None
+try:
+    import orjson as json
+except ImportError:
+    import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import dnsdb2
 import dnsdb2.saf
@@ -37,11 +50,23 @@ DEFAULT_DNSDB_SERVER = 'https://api.dnsdb.info'
 API_PREFIX = 'dnsdb/v2'
 DEFAULT_SWCLIENT = 'dnsdb2python'
 DEFAULT_VERSION = dnsdb2.__version__
+DEFAULT_POOL_MAXSIZE = 64
+DEFAULT_CACHE_SIZE = 1024
 
 METHOD_LOOKUP = 'lookup'
 METHOD_SUMMARIZE = 'summarize'
 RRTYPE_ANY = 'ANY'
 
+# Queries with limits this small are read in one request instead of being
+# streamed.
+_BUFFERED_LIMITS = (1, 2, 3)
+
+_ERROR_BODY_MAX = 4096
+
+# Queries whose responses have more lines than this are not cached, so that
+# caching does not hold a large result set in memory while it is streamed.
+_CACHE_MAX_LINES = 10000
+
 _STATUS_CODE_MAP = {
     http.HTTPStatus.UNAUTHORIZED: dnsdb2.AccessDenied,
     http.HTTPStatus.FORBIDDEN: dnsdb2.AccessDenied,
@@ -54,6 +79,12 @@ _DOC_IGNORE_LIMITED = '''\
     ignore_limited(bool): Suppress QueryLimited dnsdb2.
 '''
 
+_DOC_CACHE = '''\
+    cache (bool): Cache the results if the Client was created with a
+        cache_ttl. Results are not cached if the query did not succeed or
+        returned more than 10,000 lines.
+'''
+
 _DOC_RRTYPE_ARG = '''\
     rrtype (str): a DNS RRtype mnemonic.
 '''
@@ -157,16 +188,14 @@ def _docs_for_prefix(prefix: str) -> str:
 
 
 def _gen_rrset(prefix):
+    path_prefix = f'{prefix}/rrset/name/'
+
     def f(self, owner_name: str, rrtype: str = None, bailiwick: str = None, ignore_limited: bool = False, **params):
-        owner_name = owner_name.encode('idna')
-        path = f'{prefix}/rrset/name/{_quote(owner_name)}'
-        if rrtype:
-            path += f'/{rrtype}'
+        path = path_prefix + _quote(_idna(owner_name))
         if bailiwick:
-            bailiwick = bailiwick.encode('idna')
-            if not rrtype:
-                path += f'/{RRTYPE_ANY}'
-            path += f'/{_quote(bailiwick)}'
+            path = '/'.join((path, rrtype or RRTYPE_ANY, _quote(_idna(bailiwick))))
+        elif rrtype:
+            path = '/'.join((path, rrtype))
         return self._saf_query(path, ignore_limited=ignore_limited, **params)
 
     f.__doc__ = f'''\
@@ -191,17 +220,19 @@ Args:
 {_DOC_AGGR_ARGS}
 {_DOC_HUMANTIME_ARGS}
 {_DOC_IGNORE_LIMITED}
+{_DOC_CACHE}
 ''' + _docs_for_prefix(prefix)
 
     return f
 
 
 def _gen_rdata_name(prefix):
+    path_prefix = f'{prefix}/rdata/name/'
+
     def f(self, name: str, rrtype: str = None, ignore_limited: bool = False, **params):
-        name = name.encode('idna')
-        path = f'{prefix}/rdata/name/{_quote(name)}'
+        path = path_prefix + _quote(_idna(name))
         if rrtype:
-            path += f'/{rrtype}'
+            path = '/'.join((path, rrtype))
         return self._saf_query(path, ignore_limited=ignore_limited, **params)
 
     f.__doc__ = f'''\
@@ -218,14 +249,17 @@ Args:
 {_DOC_AGGR_ARGS}
 {_DOC_HUMANTIME_ARGS}
 {_DOC_IGNORE_LIMITED}
+{_DOC_CACHE}
 ''' + _docs_for_prefix(prefix)
 
     return f
 
 
 def _gen_rdata_ip(prefix):
+    path_prefix = f'{prefix}/rdata/ip/'
+
     def f(self, ip: str, ignore_limited: bool = False, **params):
-        path = f'''{prefix}/rdata/ip/{ip.replace('/', ',')}'''
+        path = path_prefix + ip.replace('/', ',')
         return self._saf_query(path, ignore_limited=ignore_limited, **params)
 
     f.__doc__ = f'''\
@@ -239,16 +273,19 @@ Args:
 {_DOC_AGGR_ARGS}
 {_DOC_HUMANTIME_ARGS}
 {_DOC_IGNORE_LIMITED}
+{_DOC_CACHE}
 ''' + _docs_for_prefix(prefix)
 
     return f
 
 
 def _gen_rdata_raw(prefix):
+    path_prefix = f'{prefix}/rdata/raw/'
+
     def f(self, raw_rdata: str, rrtype: str = None, ignore_limited: bool = False, **params):
-        path = f'{prefix}/rdata/raw/{raw_rdata}'
+        path = path_prefix + raw_rdata
         if rrtype:
-            path += f'/{rrtype}'
+            path = '/'.join((path, rrtype))
         return self._saf_query(path, ignore_limited=ignore_limited, **params)
 
     f.__doc__ = f'''\
@@ -263,18 +300,19 @@ Args:
 {_DOC_AGGR_ARGS}
 {_DOC_HUMANTIME_ARGS}
 {_DOC_IGNORE_LIMITED}
+{_DOC_CACHE}
 ''' + _docs_for_prefix(prefix)
 
     return f
 
 
 def _gen_flex(method, key):
-    def f(self, value: str, rrtype: str = None, ignore_limited: bool = False, **params):
-        path = f'{method}/{key}/{_quote(value)}'
+    path_prefix = f'{method}/{key}/'
 
+    def f(self, value: str, rrtype: str = None, ignore_limited: bool = False, **params):
+        path = path_prefix + _quote(value)
         if rrtype:
-            path += f'/{rrtype}'
-
+            path = '/'.join((path, rrtype))
         return self._saf_query(path, ignore_limited=ignore_limited, **params)
 
     f.__doc__ = f'''\
@@ -290,6 +328,7 @@ Args:
 {_DOC_COMMON_ARGS}
 {_DOC_OFFSET_ARGS}
 {_DOC_IGNORE_LIMITED}
+{_DOC_CACHE}
 '''
 
     return f
@@ -309,7 +348,9 @@ class Client(object):
     """
     def __init__(self, apikey: str, server: str = DEFAULT_DNSDB_SERVER,
                  swclient: str = DEFAULT_SWCLIENT, version: str = DEFAULT_VERSION,
-                 proxies: Dict[str, str] = None, insecure: bool = False):
+                 proxies: Dict[str, str] = None, insecure: bool = False,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 cache_ttl: float = 0, cache_size: int = DEFAULT_CACHE_SIZE):
         """
         Args:
             apikey (str): A DNSDB API key
@@ -317,7 +358,17 @@ class Client(object):
             swclient (str): The name of the client software reported to DNSDB.
             version (str): The version of the software reported to DNSDB.
             proxies (Dict[str, str]): HTTP proxies to use. Mapping of protocol to URL.
+                Assigning Client.proxies takes effect on the next query,
+                changes made to the dict in place do not.
             insecure (bool): Skip https validation.
+            pool_maxsize (int): Maximum number of keep-alive connections to
+                the server kept open for reuse.
+            cache_ttl (float): Seconds to cache responses for. Caching is
+                disabled if zero. When enabled, rate_limit results are cached,
+                so rate_limit may report stale quota information. Query
+                methods cache their results if called with cache=True.
+                Requires cachetools.
+            cache_size (int): Maximum number of cached responses.
         """
         self.apikey = apikey
         self.server = server
@@ -327,6 +378,69 @@ class Client(object):
         self.insecure = insecure
         self._session = requests.Session()
 
+        adapter = HTTPAdapter(
+            pool_connections=pool_maxsize,
+            pool_maxsize=pool_maxsize,
+            # 429 and 503 are reported to the caller as QuotaExceeded and
+            # ConcurrencyExceeded, so they are not retried, and Retry-After is
+            # ignored so a quota response can not block the caller.
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.2,
+                status_forcelist=(502, 504),
+                allowed_methods=('GET',),
+                raise_on_status=False,
+                respect_retry_after_header=False,
+            ),
+        )
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+
+        self._cache = None
+        if cache_ttl > 0:
+            if cachetools is None:
+                raise ImportError('cachetools is required when cache_ttl is set')
+            self._cache = cachetools.TTLCache(cache_size, cache_ttl)
+            self._cache_lock = threading.Lock()
+
+        # The url, headers, and base parameters do not change over the life of
+        # the client, so they are built once here instead of for every query.
+        self._url_base = f'{server}/{API_PREFIX}'
+        self._headers_cached = {
+            'Accept': ACCEPT_CONTENT_TYPE,
+            'X-Api-Key': apikey,
+        }
+        self._base_params_cached = {
+            'swclient': swclient,
+            'version': version,
+        }
+        self._base_query = urllib.parse.urlencode(self._base_params_cached)
+
+        # Session.get() builds a Request and re-reads proxy and CA bundle
+        # settings from the environment on every call. The server is fixed,
+        # so both are resolved once, again after proxies or insecure are
+        # assigned, and requests are sent with Session.send().
+        self._request_headers = requests.sessions.merge_setting(
+            self._headers_cached, self._session.headers, dict_class=requests.structures.CaseInsensitiveDict)
+
+    @property
+    def proxies(self) -> Dict[str, str]:
+        return self._proxies
+
+    @proxies.setter
+    def proxies(self, proxies: Dict[str, str]) -> None:
+        self._proxies = proxies
+        self._send_settings = None
+
+    @property
+    def insecure(self) -> bool:
+        return self._insecure
+
+    @insecure.setter
+    def insecure(self, insecure: bool) -> None:
+        self._insecure = insecure
+        self._send_settings = None
+
     def close(self) -> None:
         """
         Releases resources allocated by the Client.
@@ -359,67 +473,176 @@ class Client(object):
         Retrieves quota information as described in the DNSDB API v2 documentation.
         """
         path = 'rate_limit'
-        return self._json_query(path)
+        return self._json_query(path, cache=True)
 
     def _base_params(self) -> dict:
-        return {
-            'swclient': self.swclient,
-            'version': self.version,
-        }
+        """
+        Returns the parameters sent with every query. The returned dict is
+        shared and must not be mutated.
+        """
+        return self._base_params_cached
 
     def _headers(self) -> dict:
-        return {
-            'Accept': ACCEPT_CONTENT_TYPE,
-            'X-Api-Key': self.apikey,
-        }
-
-    def _json_query(self, path: str, **params):
-        url = f'{self.server}/{API_PREFIX}/{path}'
+        """
+        Returns the headers sent with every query. The returned dict is shared
+        and must not be mutated.
+        """
+        return self._headers_cached
 
-        query_params = self._base_params()
-        query_params.update(params)
+    def _encode_params(self, params: dict) -> str:
+        """
+        Encodes the base parameters and params as a query string. Like
+        requests, params override the base parameters, None values are
+        omitted, the key is repeated for each item of a list or other
+        iterable value, and other values are formatted with str().
+        """
+        if not params:
+            return self._base_query
+        if 'swclient' in params or 'version' in params:
+            pairs = []
+            params = {**self._base_params_cached, **params}
+        else:
+            pairs = [self._base_query]
+        quote_plus = urllib.parse.quote_plus
+        for k, v in params.items():
+            if isinstance(v, (str, bytes)) or not hasattr(v, '__iter__'):
+                v = (v,)
+            k = quote_plus(k)
+            pairs.extend(f'{k}={quote_plus(i if isinstance(i, (str, bytes)) else str(i))}' for i in v if i is not None)
+        return '&'.join(pairs)
+
+    def _get(self, url: str, stream: bool = False) -> requests.Response:
+        prep = requests.PreparedRequest()
+        prep.prepare(method='GET', url=url, headers=self._request_headers, cookies=self._session.cookies)
+        settings = self._send_settings
+        if settings is None:
+            settings = self._session.merge_environment_settings(
+                self._url_base, self._proxies or {}, None, not self._insecure, None)
+            del settings['stream']
+            self._send_settings = settings
+        return self._session.send(prep, stream=stream, **settings)
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            res = self._cache.get(key)
+        return copy.deepcopy(res)
+
+    def _cache_set(self, key, res) -> None:
+        with self._cache_lock:
+            self._cache[key] = res
+
+    def _json_query(self, path: str, cache: bool = False, **params):
+        if cache and self._cache is not None:
+            key = _cache_key(path, params)
+            res = self._cache_get(key)
+            if res is None:
+                res = self._json_query_uncached(path, **params)
+                self._cache_set(key, copy.deepcopy(res))
+            return res
+        return self._json_query_uncached(path, **params)
+
+    def _json_query_uncached(self, path: str, **params):
+        url = f'{self._url_base}/{path}?{self._encode_params(params)}'
 
         try:
-            with self._session.get(url,
-                                   params=query_params,
-                                   headers=self._headers(),
-                                   proxies=self.proxies,
-                                   verify=not self.insecure,
-                                   ) as res:
+            with self._get(url) as res:
                 _raise_error(res)
-                return res.json()
-        except requests.RequestException as e:
+                return json.loads(res.content)
+        except (requests.RequestException, ValueError) as e:
             raise dnsdb2.QueryError from e
 
-    def _saf_query(self, path: str, ignore_limited: bool = False, **params):
-        url = f'{self.server}/{API_PREFIX}/{path}'
+    def _saf_query(self, path: str, ignore_limited: bool = False, cache: bool = False, **params):
+        if cache and self._cache is not None:
+            # The lines of the response are cached rather than the results, a
+            # hit is decoded again by a SafIterator like a response would be.
+            key = _cache_key(path, params)
+            lines = self._cache_get(key)
+            if lines is not None:
+                return dnsdb2.saf.handle_saf(None, ignore_limited=ignore_limited, lines=lines)
+            return self._saf_query_uncached(path, ignore_limited=ignore_limited, cache_key=key, **params)
+        return self._saf_query_uncached(path, ignore_limited=ignore_limited, **params)
+
+    def _saf_query_uncached(self, path: str, ignore_limited: bool = False, cache_key: tuple = None, **params):
+        url = f'{self._url_base}/{path}?{self._encode_params(params)}'
 
-        query_params = self._base_params()
-        query_params.update(params)
+        stream = params.get('limit') not in _BUFFERED_LIMITS
 
         try:
-            res = self._session.get(
-                url,
-                headers=self._headers(),
-                params=query_params,
-                proxies=self.proxies,
-                verify=not self.insecure,
-                stream=True,
-            )
+            res = self._get(url, stream=stream)
 
             _raise_error(res)
         except requests.RequestException as e:
             raise dnsdb2.QueryError from e
 
-        return dnsdb2.saf.handle_saf(res, ignore_limited=ignore_limited)
+        lines = None if stream else filter(None, res.content.split(b'\n'))
+        if cache_key is not None:
+            return _CachingSafIterator(self, cache_key, res, ignore_limited=ignore_limited, lines=lines)
+        return dnsdb2.saf.handle_saf(res, ignore_limited=ignore_limited, lines=lines)
+
+
+class _CachingSafIterator(dnsdb2.saf.SafIterator):
+    """
+    A SafIterator that stores the lines of the response in the client's cache
+    once the query has succeeded, unless there are more than _CACHE_MAX_LINES.
+    """
+    def __init__(self, client: Client, key: tuple, res: requests.Response, ignore_limited: bool = False,
+                 lines: Iterable[bytes] = None):
+        super().__init__(res, ignore_limited=ignore_limited, lines=lines)
+        self._client = client
+        self._key = key
+        self._recorded = []
+        self._lines = self._record(self._lines)
+
+    def _record(self, lines: Iterable[bytes]):
+        for line in lines:
+            if self._recorded is not None:
+                if len(self._recorded) < _CACHE_MAX_LINES:
+                    self._recorded.append(bytes(line))
+                else:
+                    self._recorded = None
+            yield line
+
+    def __next__(self):
+        try:
+            return super().__next__()
+        except StopIteration:
+            if self.succeeded and self._recorded is not None:
+                self._client._cache_set(self._key, tuple(self._recorded))
+                self._recorded = None
+            raise
+
+
+def _cache_key(path: str, params: dict, *args) -> tuple:
+    items = ((k, tuple(v) if isinstance(v, list) else v) for k, v in params.items())
+    return (path, tuple(sorted(items))) + args
+
+
+@functools.lru_cache(maxsize=8192)
+def _idna(name: str) -> bytes:
+    return name.encode('idna')
 
 
+@functools.lru_cache(maxsize=4096)
 def _quote(path):
     return urllib.parse.quote(path, safe='')
 
 
 def _raise_error(res: requests.Response) -> None:
-    e = _STATUS_CODE_MAP.get(res.status_code)
-    if e:
-        raise e(res.text)
-    res.raise_for_status()
+    status_code = res.status_code
+    if 200 <= status_code < 300:
+        return
+    try:
+        e = _STATUS_CODE_MAP.get(status_code)
+        if e:
+            # Only the start of the body is read, error bodies may be large.
+            # Each chunk may be shorter than requested with chunked encoding.
+            body = bytearray()
+            for data in res.iter_content(_ERROR_BODY_MAX):
+                body += data
+                if len(body) >= _ERROR_BODY_MAX:
+                    break
+            raise e(body[:_ERROR_BODY_MAX].decode('utf-8', 'replace'))
+        res.raise_for_status()
+    except BaseException:
+        res.close()
+        raise
@@ -22,40 +22,40 @@
 # e: exception raised
 #
 # `search_results` is an iterable of results to be returned by calls to the
-# lookup, summarize, and flex methods. You can use the `limited` wrapper around
+# lookup, summarize, and flex methods. Reading it returns a list of the results
+# that have not been returned yet. You can use the `limited` wrapper around
 # a result if you need it to raise a `dnsdb2.QueryLimited` after returning results.
 #
 # You can make every call raise an exception by providing one through the `exception`
 # argument.
 
-from typing import Iterable
+import collections
+from typing import Iterable, List
 
 import dnsdb2
 
 
-def _raises(f):
-    def g(*args, **kwargs):
-        self = args[0]
-        if self.exception:
-            raise self.exception
-        return f(*args, **kwargs)
-    g.__name__ = f.__name__
-
-    return g
-
-
-def _records(f):
-    def g(*args, **kwargs):
+def _mock(f, searches: bool = False):
+    def g(self, *args, **kwargs):
         call = {
             'f': f.__name__,
-            'args': args[1:],
+            'args': args,
             'kwargs': kwargs,
         }
-        self = args[0]
         self.calls.append(call)
 
         try:
-            res = f(*args, **kwargs)
+            if self.exception:
+                raise self.exception
+            if searches:
+                try:
+                    res = self._search_results.popleft()
+                except IndexError:
+                    raise IndexError('search_results exhausted') from None
+                if isinstance(res, Exception):
+                    raise res
+            else:
+                res = f(self, *args, **kwargs)
             call['res'] = res
             return res
         except Exception as e:
@@ -66,17 +66,8 @@ def _records(f):
     return g
 
 
-def _searches(f):
-    def g(*args, **_):
-        self = args[0]
-        res = self.search_results[0]
-        self.search_results = self.search_results[1:]
-        if isinstance(res, Exception):
-            raise res
-        return res
-    g.__name__ = f.__name__
-
-    return g
+def _mock_search(f):
+    return _mock(f, searches=True)
 
 
 def limited(i: Iterable):
@@ -97,84 +88,68 @@ class Client:
         self.rate_limit_result = rate_limit_result
         self.search_results = search_results
 
-    @_records
-    @_raises
+    @property
+    def search_results(self) -> List:
+        return list(self._search_results)
+
+    @search_results.setter
+    def search_results(self, search_results: Iterable) -> None:
+        # Consumed from a deque so each search is O(1) rather than copying the
+        # remaining results.
+        self._search_results = collections.deque(search_results if search_results is not None else ())
+
+    @_mock
     def ping(self) -> bool:
         return self.ping_result
 
-    @_records
-    @_raises
+    @_mock
     def rate_limit(self) -> dict:
         return self.rate_limit_result
 
-    @_records
-    @_raises
-    @_searches
+    @_mock_search
     def lookup_rrset(self, owner_name: str, rrtype: str = None, bailiwick: str = None, ignore_limited: bool = False, **params):  # noqa
         pass
 
-    @_records
-    @_raises
-    @_searches
+    @_mock_search
     def summarize_rrset(self, owner_name: str, rrtype: str = None, bailiwick: str = None, ignore_limited: bool = False, **params):  # noqa
         pass
 
-    @_records
-    @_raises
-    @_searches
+    @_mock_search
     def lookup_rdata_name(self, name: str, rrtype: str = None, ignore_limited: bool = False, **params):  # noqa
         pass
 
-    @_records
-    @_raises
-    @_searches
+    @_mock_search
     def summarize_rdata_name(self, name: str, rrtype: str = None, ignore_limited: bool = False, **params):  # noqa
         pass
 
-    @_records
-    @_raises
-    @_searches
+    @_mock_search
     def lookup_rdata_ip(self, ip: str, ignore_limited: bool = False, **params):  # noqa
         pass
 
-    @_records
-    @_raises
-    @_searches
+    @_mock_search
     def summarize_rdata_ip(self, ip: str, ignore_limited: bool = False, **params):  # noqa
         pass
 
-    @_records
-    @_raises
-    @_searches
+    @_mock_search
     def lookup_rdata_raw(self, raw_rdata: str, rrtype: str = None, ignore_limited: bool = False, **params):  # noqa
         pass
 
-    @_records
-    @_raises
-    @_searches
+    @_mock_search
     def summarize_rdata_raw(self, raw_rdata: str, rrtype: str = None, ignore_limited: bool = False, **params):  # noqa
         pass
 
-    @_records
-    @_raises
-    @_searches
+    @_mock_search
     def flex_rrnames_regex(self, value: str, rrtype: str = None, ignore_limited: bool = False, **params):  # noqa
         pass
 
-    @_records
-    @_raises
-    @_searches
+    @_mock_search
     def flex_rrnames_glob(self, value: str, rrtype: str = None, ignore_limited: bool = False, **params):  # noqa
         pass
 
-    @_records
-    @_raises
-    @_searches
+    @_mock_search
     def flex_rdata_regex(self, value: str, rrtype: str = None, ignore_limited: bool = False, **params):  # noqa
         pass
 
-    @_records
-    @_raises
-    @_searches
+    @_mock_search
     def flex_rdata_glob(self, value: str, rrtype: str = None, ignore_limited: bool = False, **params):  # noqa
         pass
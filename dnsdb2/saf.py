@@ -13,7 +13,12 @@
 # limitations under the License.
 
 
-import json
+from typing import Iterable
+
+try:
+    import orjson as json
+except ImportError:
+    import json
 
 import requests
 
@@ -26,41 +31,132 @@ COND_SUCCEEDED = 'succeeded'
 COND_LIMITED = 'limited'
 COND_FAILED = 'failed'
 
+_CHUNK_SIZE = 1 << 16
+
+
+def _iter_ndjson(res: requests.Response, chunk: int = _CHUNK_SIZE):
+    """
+    Yields the non-empty lines of a newline delimited response body as bytearrays.
+    """
+    pending = bytearray()
+    for data in res.iter_content(chunk_size=chunk, decode_unicode=False):
+        pending += data
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if line:
+                yield line
+    if pending:
+        yield pending
 
-def handle_saf(res: requests.Response, ignore_limited: bool = False):
+
+def _handle_line(line: bytes) -> tuple:
+    """
+    Decodes a line of a SAF response. Returns the result it carries, or None,
+    and the exception that ends the stream, or None if the stream continues.
+    Streams that succeed are ended with StopIteration.
+    """
     try:
-        for line in res.iter_lines(decode_unicode=True):
-            if not line:
-                continue
-
-            try:
-                saf_msg = json.loads(line)
-            except json.JSONDecodeError as e:
-                raise dnsdb2.ProtocolError(f'could not decode json: {line}') from e
-
-            cond = saf_msg.get('cond')
-            obj = saf_msg.get('obj')
-            msg = saf_msg.get('msg')
-
-            if cond == COND_BEGIN:
-                continue
-            elif cond == COND_SUCCEEDED:
-                return
-
-            if obj:
-                yield obj
-
-            if cond == COND_ONGOING or not cond:
-                continue
-            elif cond == COND_LIMITED:
-                if ignore_limited:
-                    return
-                raise dnsdb2.QueryLimited(msg)
-            elif cond == COND_FAILED:
-                raise dnsdb2.QueryFailed(msg)
-            else:
-                raise dnsdb2.ProtocolError(f'invalid cond: {cond}')
-
-        raise dnsdb2.QueryTruncated()
-    finally:
-        res.close()
+        saf_msg = json.loads(line)
+    except ValueError as e:
+        text = bytes(line).decode('utf-8', 'replace')
+        raise dnsdb2.ProtocolError(f'could not decode json: {text}') from e
+
+    cond = saf_msg.get('cond')
+    obj = saf_msg.get('obj')
+
+    # Most lines only carry a result, check for them first.
+    if not cond or cond == COND_ONGOING:
+        return obj, None
+    elif cond == COND_BEGIN:
+        return None, None
+    elif cond == COND_SUCCEEDED:
+        return None, StopIteration()
+
+    msg = saf_msg.get('msg')
+    if cond == COND_LIMITED:
+        return obj, dnsdb2.QueryLimited(msg)
+    elif cond == COND_FAILED:
+        return obj, dnsdb2.QueryFailed(msg)
+    return obj, dnsdb2.ProtocolError(f'invalid cond: {cond}')
+
+
+class SafIterator(object):
+    """
+    Iterates over the results of a Streaming Application Framework response.
+
+    Raises QueryLimited, QueryFailed, QueryTruncated, or ProtocolError once
+    the results preceding the terminating condition have been returned. The
+    response is closed when iteration ends, or by close() or leaving a with
+    block.
+
+    The non-empty lines of the response are read from res unless they are
+    provided through lines, in which case res may be None.
+
+    succeeded is set once the server has reported that the query succeeded.
+    """
+    def __init__(self, res: requests.Response, ignore_limited: bool = False, lines: Iterable[bytes] = None):
+        self._res = res
+        self._lines = _iter_ndjson(res) if lines is None else iter(lines)
+        self._ignore_limited = ignore_limited
+        self._exc = None
+        self._done = False
+        self.succeeded = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        if self._exc is not None:
+            exc, self._exc = self._exc, None
+            self.close()
+            raise exc
+
+        try:
+            for line in self._lines:
+                obj, exc = _handle_line(line)
+                if exc is None:
+                    if obj:
+                        return obj
+                    continue
+                elif isinstance(exc, StopIteration):
+                    self.succeeded = True
+                elif self._ignore_limited and isinstance(exc, dnsdb2.QueryLimited):
+                    exc = StopIteration()
+
+                # The result accompanying a terminating condition is returned
+                # before the condition is raised.
+                if obj:
+                    self._exc = exc
+                    return obj
+                raise exc
+
+            raise dnsdb2.QueryTruncated()
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        """
+        Releases the underlying response.
+        """
+        if not self._done:
+            self._done = True
+            if self._res is not None:
+                self._res.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        if hasattr(self, '_done'):
+            self.close()
+
+
+def handle_saf(res: requests.Response, ignore_limited: bool = False, lines: Iterable[bytes] = None) -> SafIterator:
+    return SafIterator(res, ignore_limited=ignore_limited, lines=lines)
@@ -0,0 +1,118 @@
+# Copyright (c) 2020 by Farsight Security, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+import pytest
+
+import dnsdb2
+
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    import dnsdb2.aio
+except ImportError:
+    web = None
+
+
+# IsolatedAsyncioTestCase was added in Python 3.8.
+_AsyncTestCase = getattr(unittest, 'IsolatedAsyncioTestCase', None)
+
+
+@unittest.skipIf(web is None, 'aiohttp not installed')
+@unittest.skipIf(_AsyncTestCase is None, 'Python 3.8 or greater required')
+class TestAsyncClient(_AsyncTestCase or unittest.TestCase):
+    async def asyncSetUp(self) -> None:
+        self.apikey = 'abcdef-ghijkl-mnopqrstuvwxyz'
+        self.swclient = 'abc-client'
+        self.version = 'v1.2.3.4'
+        self.routes = {}
+        self.requests = []
+
+        async def handler(request):
+            self.requests.append(request)
+            return self.routes[request.path]
+
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+        self.client = dnsdb2.aio.AsyncClient(server=str(self.server.make_url('')).rstrip('/'), apikey=self.apikey,
+                                             swclient=self.swclient, version=self.version)
+
+    async def asyncTearDown(self) -> None:
+        await self.client.close()
+        await self.server.close()
+
+    async def test_ping(self):
+        self.routes['/dnsdb/v2/ping'] = web.json_response({'ping': 'ok'})
+        assert await self.client.ping(), 'ping ok'
+
+        request = self.requests[0]
+        assert self.apikey == request.headers.get('X-Api-Key'), 'X-Api-Key header'
+        assert dnsdb2.client.ACCEPT_CONTENT_TYPE == request.headers.get('Accept'), 'Accept header'
+        assert self.swclient == request.query.get('swclient'), 'swclient'
+        assert self.version == request.query.get('version'), 'version'
+
+    async def test_rate_limit_403(self):
+        self.routes['/dnsdb/v2/rate_limit'] = web.Response(status=403)
+        with pytest.raises(dnsdb2.AccessDenied):
+            await self.client.rate_limit()
+
+    async def test_query(self):
+        records = [
+            '{"count":1820,"rrname":"farsightsecurity.com.","rrtype":"NS","rdata":["ns5.dnsmadeeasy.com."]}',
+            '{"count":6350,"rrname":"farsightsecurity.com.","rrtype":"A","rdata":["66.160.140.81"]}',
+        ]
+        self.routes['/dnsdb/v2/lookup/rrset/name/farsightsecurity.com/A'] = web.Response(
+            text='\n'.join(['{"cond": "begin"}'] + [f'{{"obj":{r}}}' for r in records] + ['{"cond": "limited"}']))
+
+        actual = []
+        with pytest.raises(dnsdb2.QueryLimited):
+            async for rrset in self.client.lookup_rrset('farsightsecurity.com', rrtype='A', aggr=False):
+                actual.append(rrset)
+        assert [json.loads(r) for r in records] == actual
+        assert 'False' == self.requests[0].query.get('aggr'), 'aggr'
+
+    async def test_rate_limit_bad_json(self):
+        self.routes['/dnsdb/v2/rate_limit'] = web.Response(text='{"rate": ')
+        with pytest.raises(dnsdb2.QueryError):
+            await self.client.rate_limit()
+
+    async def test_no_timeout(self):
+        self.routes['/dnsdb/v2/ping'] = web.json_response({'ping': 'ok'})
+        assert await self.client.ping(), 'ping ok'
+        assert self.client._session.timeout.total is None, 'timeout'
+
+    async def test_query_cache_not_sent(self):
+        self.routes['/dnsdb/v2/lookup/rrset/name/farsightsecurity.com'] = web.Response(
+            text='\n'.join(['{"cond": "begin"}', '{"cond": "succeeded"}']))
+
+        assert [] == [rrset async for rrset in self.client.lookup_rrset('farsightsecurity.com', cache=True)]
+        assert 'cache' not in self.requests[0].query, 'cache'
+
+    async def test_query_broken_json(self):
+        self.routes['/dnsdb/v2/file/broken'] = web.Response(text='{"cond": ')
+        with pytest.raises(dnsdb2.ProtocolError, match='could not decode json: {"cond": $'):
+            async for _ in self.client._saf_query('file/broken'):
+                pass
+
+    async def test_query_404(self):
+        self.routes['/dnsdb/v2/file/not/found'] = web.Response(status=404)
+        with pytest.raises(dnsdb2.QueryError):
+            async for _ in self.client._saf_query('file/not/found'):
+                pass
+
@@ -12,310 +12,433 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import json
-from typing import List
-import unittest
+import functools
+import http.server
+import threading
+from types import MappingProxyType
+from typing import Tuple
 
-import requests_mock
+try:
+    import orjson as json
+except ImportError:
+    import json
+
+import pytest
 
 import dnsdb2
+import dnsdb2.saf
+
+from .test_saf import _StubResponse
+
+
+PREFIX = 'abc'
+FLEX_METHOD = 'def'
+PARAMS = MappingProxyType({'a': 'b'})
+
+IDN_OWNER = 'å∫ç'
+IDN_BAILIWICK = '∂éƒ'
+IDN_NAME = '∂éƒ'
+_IDNA_OWNER = IDN_OWNER.encode('idna').decode('ascii')
+_IDNA_BAILIWICK = IDN_BAILIWICK.encode('idna').decode('ascii')
+_IDNA_NAME = IDN_NAME.encode('idna').decode('ascii')
+
+RRSET = dnsdb2.client._gen_rrset(PREFIX)
+RDATA_NAME = dnsdb2.client._gen_rdata_name(PREFIX)
+RDATA_IP = dnsdb2.client._gen_rdata_ip(PREFIX)
+RDATA_RAW = dnsdb2.client._gen_rdata_raw(PREFIX)
+FLEX = dnsdb2.client._gen_flex(PREFIX, FLEX_METHOD)
+
+
+class SafQueryRecorder:
+    """
+    Replaces Client._saf_query, recording the arguments it is called with.
+    """
+    def __call__(self, path, ignore_limited=False, **params):
+        self.path = path
+        self.ignore_limited = ignore_limited
+        self.params = params
+
+
+@pytest.fixture
+def recorder(monkeypatch, client):
+    recorder = SafQueryRecorder()
+    monkeypatch.setattr(client, '_saf_query', recorder)
+    return recorder
+
+
+class TestGenerators:
+    @pytest.mark.parametrize('owner_name,rrtype,bailiwick,ignore_limited,expected_path', [
+        ('def', None, None, False, f'{PREFIX}/rrset/name/def'),
+        ('def', 'A', None, False, f'{PREFIX}/rrset/name/def/A'),
+        ('def', None, 'ghi', False, f'{PREFIX}/rrset/name/def/{dnsdb2.client.RRTYPE_ANY}/ghi'),
+        ('def', 'A', 'ghi', False, f'{PREFIX}/rrset/name/def/A/ghi'),
+        ('de/f', None, 'gh,i', False,
+         f'{PREFIX}/rrset/name/{dnsdb2.client._quote("de/f")}/{dnsdb2.client.RRTYPE_ANY}/{dnsdb2.client._quote("gh,i")}'),  # nopep8
+        (IDN_OWNER, None, IDN_BAILIWICK, False,
+         f'{PREFIX}/rrset/name/{_IDNA_OWNER}/{dnsdb2.client.RRTYPE_ANY}/{_IDNA_BAILIWICK}'),
+        ('def', None, None, True, f'{PREFIX}/rrset/name/def'),
+    ])
+    def test_rrset(self, client, recorder, owner_name, rrtype, bailiwick, ignore_limited, expected_path):
+        RRSET(client, owner_name, rrtype=rrtype, bailiwick=bailiwick, ignore_limited=ignore_limited, **PARAMS)
+        assert expected_path == recorder.path, 'url path'
+        assert PARAMS == recorder.params, 'params'
+        assert ignore_limited == recorder.ignore_limited
+
+    @pytest.mark.parametrize('f,value,kwargs,expected_path', [
+        (RDATA_NAME, 'def', {}, f'{PREFIX}/rdata/name/def'),
+        (RDATA_NAME, 'def', {'rrtype': 'A'}, f'{PREFIX}/rdata/name/def/A'),
+        (RDATA_NAME, 'de/f', {}, f'{PREFIX}/rdata/name/{dnsdb2.client._quote("de/f")}'),
+        (RDATA_NAME, IDN_NAME, {}, f'{PREFIX}/rdata/name/{_IDNA_NAME}'),
+        (RDATA_NAME, 'def', {'ignore_limited': True}, f'{PREFIX}/rdata/name/def'),
+        (RDATA_IP, '1.2.3.4', {}, f'{PREFIX}/rdata/ip/1.2.3.4'),
+        (RDATA_IP, '1.2.3.0/24', {}, f'{PREFIX}/rdata/ip/1.2.3.0,24'),
+        (RDATA_IP, '1.2.3.4-5.6.7.8', {}, f'{PREFIX}/rdata/ip/1.2.3.4-5.6.7.8'),
+        (RDATA_IP, '1.2.3.4', {'ignore_limited': True}, f'{PREFIX}/rdata/ip/1.2.3.4'),
+        (RDATA_RAW, 'abcd', {}, f'{PREFIX}/rdata/raw/abcd'),
+        (RDATA_RAW, 'abcd', {'rrtype': 'A'}, f'{PREFIX}/rdata/raw/abcd/A'),
+        (RDATA_RAW, 'abcd', {'ignore_limited': True}, f'{PREFIX}/rdata/raw/abcd'),
+    ])
+    def test_rdata(self, client, recorder, f, value, kwargs, expected_path):
+        f(client, value, **kwargs, **PARAMS)
+        assert expected_path == recorder.path, 'url path'
+        assert PARAMS == recorder.params, 'params'
+        assert kwargs.get('ignore_limited', False) == recorder.ignore_limited
+
+    @pytest.mark.parametrize('value,rrtype,ignore_limited,expected_path', [
+        ('a+b*c?d', None, False, f'{PREFIX}/{FLEX_METHOD}/{dnsdb2.client._quote("a+b*c?d")}'),
+        ('a+b*c?d', 'A', False, f'{PREFIX}/{FLEX_METHOD}/{dnsdb2.client._quote("a+b*c?d")}/A'),
+        ('a+b*c?d', None, True, f'{PREFIX}/{FLEX_METHOD}/{dnsdb2.client._quote("a+b*c?d")}'),
+    ])
+    def test_flex(self, client, recorder, value, rrtype, ignore_limited, expected_path):
+        FLEX(client, value, rrtype=rrtype, ignore_limited=ignore_limited, **PARAMS)
+        assert expected_path == recorder.path, 'url path'
+        assert PARAMS == recorder.params, 'params'
+        assert ignore_limited == recorder.ignore_limited
+
+
+SERVER = 'https://unit.test'
+APIKEY = 'abcdef-ghijkl-mnopqrstuvwxyz'
+SWCLIENT = 'abc-client'
+VERSION = 'v1.2.3.4'
+
+
+def url_for(path: str) -> str:
+    return f'{SERVER}/dnsdb/v2/{path}?swclient={SWCLIENT}&version={VERSION}'
+
+
+PING_URL = url_for('ping')
+RATE_LIMIT_URL = url_for('rate_limit')
+
+RECORDS = [
+    '{"count":1820,"zone_time_first":1374250920,"zone_time_last":1589472138,"rrname":"farsightsecurity.com.",'
+    '"rrtype":"NS","bailiwick":"com.","rdata":["ns5.dnsmadeeasy.com.","ns6.dnsmadeeasy.com.","ns7.dnsmadeeasy'
+    '.com."]}',
+    '{"count":6350,"time_first":1380123423,"time_last":1427869045,"rrname":"farsightsecurity.com.","rrtype":"'
+    'A","bailiwick":"farsightsecurity.com.","rdata":["66.160.140.81"]}',
+]
+EXPECTED_RECORDS = [json.loads(r) for r in RECORDS]
+
+
+class _StatusHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Responds to every request with the server's status and headers, counting
+    the requests received.
+    """
+    def do_GET(self):
+        self.server.requests += 1
+        self.send_response(self.server.status)
+        for k, v in self.server.headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def status_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _StatusHandler)
+    server.requests = 0
+    server.headers = {}
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='module')
+def client():
+    c = dnsdb2.Client(server=SERVER, apikey=APIKEY, swclient=SWCLIENT, version=VERSION)
+    yield c
+    c.close()
+
+
+@pytest.fixture
+def cache_client():
+    c = dnsdb2.Client(server=SERVER, apikey=APIKEY, swclient=SWCLIENT, version=VERSION, cache_ttl=60)
+    yield c
+    c.close()
+
+
+class TestDnsdbClient:
+    @pytest.fixture(autouse=True)
+    def default_routes(self, requests_mock, client):
+        """
+        Registers successful ping and rate_limit responses. Tests register their
+        own responses for the same urls to override them.
+        """
+        requests_mock.get(
+            PING_URL,
+            json={'ping': 'ok'},
+            request_headers=client._headers(),
+        )
+        requests_mock.get(
+            RATE_LIMIT_URL,
+            json={'rate': {'foo': 1}},
+            request_headers=client._headers(),
+        )
+
+    def test_headers(self, client):
+        headers = client._headers()
+        assert APIKEY == headers.get('X-Api-Key'), 'X-Api-Key header'
+        assert dnsdb2.client.ACCEPT_CONTENT_TYPE == headers.get('Accept'), 'Accept header'
+
+    def test_base_params(self, client):
+        params = client._base_params()
+        assert client.swclient == params.get('swclient'), 'swclient'
+        assert client.version == params.get('version'), 'version'
+
+    def test_encode_params(self, client):
+        assert f'swclient={SWCLIENT}&version={VERSION}&limit=1&aggr=False&exclude=a+b%2Fc' == \
+            client._encode_params({'limit': 1, 'aggr': False, 'exclude': 'a b/c', 'id': None})
+
+    def test_encode_params_override(self, client):
+        assert f'swclient=x&version={VERSION}&limit=1' == client._encode_params({'swclient': 'x', 'limit': 1})
+        assert 'swclient=x' == client._encode_params({'swclient': 'x', 'version': None})
+
+    def test_encode_params_list(self, client):
+        assert f'swclient={SWCLIENT}&version={VERSION}&ids=a&ids=b+c' == \
+            client._encode_params({'ids': ['a', None, 'b c']})
+
+    def test_adapter(self, client):
+        adapter = client._session.get_adapter(SERVER)
+        assert dnsdb2.client.DEFAULT_POOL_MAXSIZE == adapter._pool_maxsize, 'pool_maxsize'
+        assert 3 == adapter.max_retries.total, 'max_retries'
+
+    def test_send_settings(self, requests_mock):
+        c = dnsdb2.Client(server=SERVER, apikey=APIKEY, swclient=SWCLIENT, version=VERSION)
+        try:
+            assert c.ping()
+            assert requests_mock.last_request.verify
+            c.insecure = True
+            c.proxies = {'https': 'http://proxy.test:3128'}
+            assert c.ping()
+            assert not requests_mock.last_request.verify, 'insecure'
+            assert 'http://proxy.test:3128' == requests_mock.last_request.proxies.get('https'), 'proxies'
+        finally:
+            c.close()
+
+    def test_ping(self, client):
+        assert client.ping(), 'ping ok'
+
+    def test_ping_fail(self, client, requests_mock):
+        requests_mock.get(
+            PING_URL,
+            status_code=403,
+            request_headers=client._headers(),
+        )
+        with pytest.raises(dnsdb2.DnsdbException):
+            client.ping()
+
+    def test_error_body_truncated(self, client, requests_mock):
+        requests_mock.get(
+            RATE_LIMIT_URL,
+            status_code=429,
+            text='x' * (dnsdb2.client._ERROR_BODY_MAX * 2),
+            request_headers=client._headers(),
+        )
 
+        with pytest.raises(dnsdb2.QuotaExceeded) as e:
+            client.rate_limit()
+        assert 'x' * dnsdb2.client._ERROR_BODY_MAX == str(e.value)
 
-class TestGenerators(unittest.TestCase):
-    prefix = 'abc'
-
-    def setUp(self):
-        self.params = {'a': 'b'}
-        self.ignore_limited = False
-
-    rrset = dnsdb2.client._gen_rrset(prefix)
-
-    def test_rrset(self):
-        owner_name = 'def'
-        self.path = f'{self.prefix}/rrset/name/{owner_name}'
-        self.rrset(owner_name, **self.params)
-
-    def test_rrset_with_rrtype(self):
-        owner_name = 'def'
-        rrtype = 'A'
-        self.path = f'{self.prefix}/rrset/name/{owner_name}/{rrtype}'
-        self.rrset(owner_name, rrtype=rrtype, **self.params)
-
-    def test_rrset_with_bailiwick(self):
-        owner_name = 'def'
-        bailiwick = 'ghi'
-        self.path = f'{self.prefix}/rrset/name/{owner_name}/{dnsdb2.client.RRTYPE_ANY}/{bailiwick}'
-        self.rrset(owner_name, bailiwick=bailiwick, **self.params)
-
-    def test_rrset_with_bailiwick_and_rrtype(self):
-        owner_name = 'def'
-        rrtype = 'A'
-        bailiwick = 'ghi'
-        self.path = f'{self.prefix}/rrset/name/{owner_name}/{rrtype}/{bailiwick}'
-        self.rrset(owner_name, rrtype=rrtype, bailiwick=bailiwick, **self.params)
-
-    def test_rrset_quoting(self):
-        owner_name = 'de/f'
-        bailiwick = 'gh,i'
-        self.path = f'{self.prefix}/rrset/name/{dnsdb2.client._quote(owner_name)}/{dnsdb2.client.RRTYPE_ANY}/{dnsdb2.client._quote(bailiwick)}'  # nopep8
-        self.rrset(owner_name, bailiwick=bailiwick, **self.params)
-
-    def test_rrset_idna(self):
-        owner_name = 'å∫ç'
-        bailiwick = '∂éƒ'
-        self.path = f'''{self.prefix}/rrset/name/{owner_name.encode('idna').decode('ascii')}/{dnsdb2.client.RRTYPE_ANY}/{bailiwick.encode('idna').decode('ascii')}'''  # nopep8
-        self.rrset(owner_name, bailiwick=bailiwick, **self.params)
-
-    def test_rrset_ignore_limited(self):
-        owner_name = 'def'
-        self.path = f'{self.prefix}/rrset/name/{owner_name}'
-        self.ignore_limited = True
-        self.rrset(owner_name, ignore_limited=True, **self.params)
-
-    rdata_name = dnsdb2.client._gen_rdata_name(prefix)
-
-    def test_rdata_name(self):
-        name = 'def'
-        self.path = f'{self.prefix}/rdata/name/{name}'
-        self.rdata_name(name, **self.params)
-
-    def test_rdata_name_rrtype(self):
-        name = 'def'
-        rrtype = 'A'
-        self.path = f'{self.prefix}/rdata/name/{name}/{rrtype}'
-        self.rdata_name(name, rrtype=rrtype, **self.params)
-
-    def test_rdata_name_quoting(self):
-        name = 'de/f'
-        self.path = f'{self.prefix}/rdata/name/{dnsdb2.client._quote(name)}'
-        self.rdata_name(name, **self.params)
-
-    def test_rdata_name_idna(self):
-        name = '∂éƒ'
-        self.path = f'''{self.prefix}/rdata/name/{name.encode('idna').decode('ascii')}'''
-        self.rdata_name(name, **self.params)
-
-    def test_rdata_name_ignore_limited(self):
-        name = 'def'
-        self.path = f'{self.prefix}/rdata/name/{name}'
-        self.ignore_limited = True
-        self.rdata_name(name, ignore_limited=True, **self.params)
-
-    rdata_ip = dnsdb2.client._gen_rdata_ip(prefix)
-
-    def test_rdata_ip(self):
-        ip = '1.2.3.4'
-        self.path = f'{self.prefix}/rdata/ip/{ip}'
-        self.rdata_ip(ip, **self.params)
-
-    def test_rdata_ip_cidr(self):
-        ip = '1.2.3.0/24'
-        self.path = f'''{self.prefix}/rdata/ip/{ip.replace('/', ',')}'''
-        self.rdata_ip(ip, **self.params)
-
-    def test_rdata_range(self):
-        ip = '1.2.3.4-5.6.7.8'
-        self.path = f'{self.prefix}/rdata/ip/{ip}'
-        self.rdata_ip(ip, **self.params)
-
-    def test_rdata_ip_ignore_limited(self):
-        ip = '1.2.3.4'
-        self.path = f'{self.prefix}/rdata/ip/{ip}'
-        self.ignore_limited = True
-        self.rdata_ip(ip, ignore_limited=True, **self.params)
-
-    rdata_raw = dnsdb2.client._gen_rdata_raw(prefix)
-
-    def test_rdata_raw(self):
-        raw_rdata = 'abcd'
-        self.path = f'{self.prefix}/rdata/raw/{raw_rdata}'
-        self.rdata_raw(raw_rdata, **self.params)
-
-    def test_rdata_raw_rrtype(self):
-        raw_rdata = 'abcd'
-        rrtype = 'A'
-        self.path = f'{self.prefix}/rdata/raw/{raw_rdata}/{rrtype}'
-        self.rdata_raw(raw_rdata, rrtype=rrtype, **self.params)
-
-    def test_rdata_raw_ignore_limited(self):
-        raw_rdata = 'abcd'
-        self.path = f'{self.prefix}/rdata/raw/{raw_rdata}'
-        self.ignore_limited = True
-        self.rdata_raw(raw_rdata, ignore_limited=True, **self.params)
-
-    flexMethod = 'def'
-    flex = dnsdb2.client._gen_flex(prefix, flexMethod)
-
-    def test_flex(self):
-        value = 'a+b*c?d'
-        self.path = f'{self.prefix}/{self.flexMethod}/{dnsdb2.client._quote(value)}'
-        self.flex(value, **self.params)
-
-    def test_flex_rrtype(self):
-        value = 'a+b*c?d'
-        rrtype = 'A'
-        self.path = f'{self.prefix}/{self.flexMethod}/{dnsdb2.client._quote(value)}/{rrtype}'
-        self.flex(value, rrtype=rrtype, **self.params)
-
-    def test_flex_ignore_limited(self):
-        value = 'a+b*c?d'
-        self.path = f'{self.prefix}/{self.flexMethod}/{dnsdb2.client._quote(value)}'
-        self.ignore_limited = True
-        self.flex(value, ignore_limited=True, **self.params)
-
-    def _saf_query(self, path, ignore_limited=False, **params):
-        self.assertEqual(self.path, path, 'url path')
-        self.assertEqual(self.params, params, 'params')
-        self.assertEqual(self.ignore_limited, ignore_limited)
-
-
-@requests_mock.Mocker()
-class TestDnsdbClient(unittest.TestCase):
-    def setUp(self) -> None:
-        self.server = 'https://unit.test'
-        self.apikey = 'abcdef-ghijkl-mnopqrstuvwxyz'
-        self.swclient = 'abc-client'
-        self.version = 'v1.2.3.4'
-        self.client = dnsdb2.Client(server=self.server, apikey=self.apikey,
-                                    swclient=self.swclient, version=self.version)
-
-    def test_headers(self, _):
-        headers = self.client._headers()
-        self.assertEqual(self.apikey, headers.get('X-Api-Key'), 'X-Api-Key header')
-        self.assertEqual(dnsdb2.client.ACCEPT_CONTENT_TYPE, headers.get('Accept'), 'Accept header')
-
-    def test_base_params(self, _):
-        params = self.client._base_params()
-        self.assertEqual(self.client.swclient, params.get('swclient'), 'swclient')
-        self.assertEqual(self.client.version, params.get('version'), 'version')
-
-    def test_ping(self, m):
-        m.get(
-            f'{self.server}/dnsdb/v2/ping?swclient={self.swclient}&version={self.version}',
-            json={'ping': 'ok'},
-            request_headers=self.client._headers(),
+    def test_error_body_chunked(self):
+        with pytest.raises(dnsdb2.QuotaExceeded) as e:
+            dnsdb2.client._raise_error(_StubResponse(chunks=[b'x' * 100] * 100, status_code=429))
+        assert 'x' * dnsdb2.client._ERROR_BODY_MAX == str(e.value)
+
+    def test_rate_limit(self, client):
+        assert {'rate': {'foo': 1}} == client.rate_limit()
+
+    def test_rate_limit_404(self, client, requests_mock):
+        requests_mock.get(
+            RATE_LIMIT_URL,
+            status_code=404,
+            request_headers=client._headers(),
         )
-        self.assertTrue(self.client.ping(), 'ping ok')
 
-    def test_ping_fail(self, m):
-        m.get(
-            f'{self.server}/dnsdb/v2/ping?swclient={self.swclient}&version={self.version}',
+        with pytest.raises(dnsdb2.DnsdbException):
+            client.rate_limit()
+
+    def test_rate_limit_403(self, client, requests_mock):
+        requests_mock.get(
+            RATE_LIMIT_URL,
             status_code=403,
-            request_headers=self.client._headers(),
+            request_headers=client._headers(),
         )
-        self.assertRaises(dnsdb2.DnsdbException, self.client.ping)
 
-    def test_rate_limit(self, m):
+        with pytest.raises(dnsdb2.AccessDenied):
+            client.rate_limit()
+
+    def test_query(self, client, requests_mock):
+        path = 'test/path'
+
+        requests_mock.get(
+            url_for(path),
+            text='\n'.join(saf_wrap(tuple(RECORDS))),
+            request_headers=client._headers(),
+        )
+
+        i = 0
+        for rrset in client._saf_query(path):
+            assert EXPECTED_RECORDS[i] == rrset
+            i += 1
+        assert len(EXPECTED_RECORDS) == i, "All records consumed"
+
+    def test_rate_limit_cached(self, cache_client, requests_mock):
         expected = {'rate': {'foo': 1}}
-        m.get(f'{self.server}/dnsdb/v2/rate_limit?swclient={self.swclient}&version={self.version}',
-              json=expected,
-              request_headers=self.client._headers(),
-              )
-
-        self.assertEqual(expected, self.client.rate_limit())
-
-    def test_rate_limit_404(self, m):
-        m.get(f'{self.server}/dnsdb/v2/rate_limit?swclient={self.swclient}&version={self.version}',
-              status_code=404,
-              request_headers=self.client._headers(),
-              )
-
-        self.assertRaises(dnsdb2.DnsdbException, self.client.rate_limit)
-
-    def test_rate_limit_403(self, m):
-        m.get(f'{self.server}/dnsdb/v2/rate_limit?swclient={self.swclient}&version={self.version}',
-              status_code=403,
-              request_headers=self.client._headers(),
-              )
-
-        self.assertRaises(dnsdb2.AccessDenied, self.client.rate_limit)
-
-    def test_query(self, m):
-        records = [
-            '{"count":1820,"zone_time_first":1374250920,"zone_time_last":1589472138,"rrname":"farsightsecurity.com.",'
-            '"rrtype":"NS","bailiwick":"com.","rdata":["ns5.dnsmadeeasy.com.","ns6.dnsmadeeasy.com.","ns7.dnsmadeeasy'
-            '.com."]}',
-            '{"count":6350,"time_first":1380123423,"time_last":1427869045,"rrname":"farsightsecurity.com.","rrtype":"'
-            'A","bailiwick":"farsightsecurity.com.","rdata":["66.160.140.81"]}',
-        ]
+        assert expected == cache_client.rate_limit()
+        assert expected == cache_client.rate_limit()
+        assert 1 == requests_mock.call_count, 'cached'
+
+    def test_query_cached(self, cache_client, requests_mock):
         path = 'test/path'
 
-        m.get(
-            '{server}/dnsdb/v2/{path}?swclient={swclient}&version={version}'.format(
-                server=self.client.server,
-                path=path,
-                swclient=self.client.swclient,
-                version=self.client.version,
-            ),
-            text='\n'.join(saf_wrap(records)),
-            request_headers=self.client._headers(),
+        requests_mock.get(
+            url_for(path),
+            text='\n'.join(saf_wrap(tuple(RECORDS))),
+            request_headers=cache_client._headers(),
         )
 
-        for rrset in self.client._saf_query(path):
-            self.assertEqual(json.loads(records[0]), rrset)
-            records = records[1:]
-        self.assertListEqual([], records, "All records consumed")
+        assert EXPECTED_RECORDS == list(cache_client._saf_query(path, cache=True))
+        with cache_client._saf_query(path, cache=True) as res:
+            assert isinstance(res, dnsdb2.saf.SafIterator)
+            assert EXPECTED_RECORDS == list(res)
+        assert 1 == requests_mock.call_count, 'cached'
 
-    def test_query_403(self, m):
+    def test_query_large_not_cached(self, cache_client, requests_mock, monkeypatch):
         path = 'test/path'
 
-        m.get(
-            '{server}/dnsdb/v2/{path}?swclient={swclient}&version={version}'.format(
-                server=self.client.server,
-                path=path,
-                swclient=self.client.swclient,
-                version=self.client.version,
-            ),
-            status_code=403,
-            request_headers=self.client._headers(),
+        monkeypatch.setattr(dnsdb2.client, '_CACHE_MAX_LINES', len(RECORDS))
+        requests_mock.get(
+            url_for(path),
+            text='\n'.join(saf_wrap(tuple(RECORDS))),
+            request_headers=cache_client._headers(),
         )
 
-        self.assertRaises(dnsdb2.AccessDenied, self.client._saf_query, path)
+        assert EXPECTED_RECORDS == list(cache_client._saf_query(path, cache=True))
+        assert EXPECTED_RECORDS == list(cache_client._saf_query(path, cache=True))
+        assert 2 == requests_mock.call_count, 'not cached'
 
-    def test_query_404(self, m):
-        path = 'file/not/found'
+    def test_query_limited_not_cached(self, cache_client, requests_mock):
+        path = 'test/path'
 
-        m.get(
-            '{server}/dnsdb/v2/{path}?swclient={swclient}&version={version}'.format(
-                server=self.client.server,
-                path=path,
-                swclient=self.client.swclient,
-                version=self.client.version,
-            ),
-            status_code=404,
-            request_headers=self.client._headers(),
+        requests_mock.get(
+            url_for(path),
+            text='\n'.join(saf_wrap(tuple(RECORDS), limited=True)),
+            request_headers=cache_client._headers(),
         )
 
-        self.assertRaises(dnsdb2.QueryError, self.client._saf_query, path)
+        assert EXPECTED_RECORDS == list(cache_client._saf_query(path, ignore_limited=True, cache=True))
+        assert EXPECTED_RECORDS == list(cache_client._saf_query(path, ignore_limited=True, cache=True))
+        assert 2 == requests_mock.call_count, 'not cached'
+
+    def test_ping_not_cached(self, cache_client, requests_mock):
+        assert cache_client.ping()
+        assert cache_client.ping()
+        assert 2 == requests_mock.call_count, 'not cached'
+
+    def test_query_buffered(self, client, requests_mock):
+        path = 'test/path'
+
+        requests_mock.get(
+            url_for(path) + '&limit=1',
+            text='\n'.join(saf_wrap(tuple(RECORDS[:1]), limited=True)),
+            request_headers=client._headers(),
+        )
 
+        res = client._saf_query(path, limit=1)
+        assert not requests_mock.last_request.stream, 'buffered'
+        assert EXPECTED_RECORDS[0] == next(res)
+        with pytest.raises(dnsdb2.QueryLimited):
+            next(res)
 
-class TestQuote(unittest.TestCase):
-    def testBasic(self):
-        self._run_test('abc', 'abc')
+    def test_query_403(self, client, requests_mock):
+        path = 'test/path'
 
-    def testComma(self):
-        self._run_test('ab,c', 'ab%2Cc')
+        requests_mock.get(
+            url_for(path),
+            status_code=403,
+            request_headers=client._headers(),
+        )
 
-    def testSlash(self):
-        self._run_test('ab/c', 'ab%2Fc')
+        with pytest.raises(dnsdb2.AccessDenied):
+            client._saf_query(path)
 
-    def _run_test(self, test, expected):
-        self.assertEqual(expected, dnsdb2.client._quote(test))
+    def test_query_404(self, client, requests_mock):
+        path = 'file/not/found'
 
+        requests_mock.get(
+            url_for(path),
+            status_code=404,
+            request_headers=client._headers(),
+        )
 
-def saf_wrap(records, limited=False, failed=False, truncated=False) -> List[str]:
-    header = ['{"cond": "begin"}']
+        with pytest.raises(dnsdb2.QueryError):
+            client._saf_query(path)
+
+
+class TestRetries:
+    @pytest.mark.parametrize('status,e', [
+        (429, dnsdb2.QuotaExceeded),
+        (503, dnsdb2.ConcurrencyExceeded),
+    ])
+    def test_error_not_retried(self, status_server, status, e):
+        status_server.status = status
+        status_server.headers = {'Retry-After': '2'}
+        c = dnsdb2.Client(server=f'http://127.0.0.1:{status_server.server_port}', apikey=APIKEY)
+        try:
+            with pytest.raises(e):
+                c.rate_limit()
+            with pytest.raises(e):
+                c.lookup_rrset('farsightsecurity.com')
+        finally:
+            c.close()
+        assert 2 == status_server.requests, 'not retried'
+
+
+class TestQuote:
+    @pytest.mark.parametrize('test,expected', [
+        ('abc', 'abc'),
+        ('ab,c', 'ab%2Cc'),
+        ('ab/c', 'ab%2Fc'),
+    ])
+    def test_quote(self, test, expected):
+        assert expected == dnsdb2.client._quote(test)
+
+
+@functools.lru_cache(maxsize=None)
+def saf_wrap(records: Tuple[str, ...], limited=False, failed=False, truncated=False) -> Tuple[str, ...]:
+    header = ('{"cond": "begin"}',)
     if limited:
-        trailer = ['{"cond": "limited"}']
+        trailer = ('{"cond": "limited"}',)
     elif failed:
-        trailer = ['{"cond": "failed"}']
+        trailer = ('{"cond": "failed"}',)
     elif truncated:
-        trailer = []
+        trailer = ()
     else:
-        trailer = ['{"cond": "succeeded"}']
-
-    return header + [f'{{"obj":{obj}}}' for obj in records] + trailer
-
+        trailer = ('{"cond": "succeeded"}',)
 
-if __name__ == '__main__':
-    unittest.main()
+    return header + tuple(f'{{"obj":{obj}}}' for obj in records) + trailer
@@ -15,42 +15,42 @@
 import re
 import os
 import time
-from typing import Generator
-import unittest
+from types import MappingProxyType
+from typing import Iterator
+
+import pytest
 
 import dnsdb2
 
+_FARSIGHT_RE = re.compile(r'fa*rsight?security\.com\.$')
+_SUBDOMAIN_RE = re.compile(r'.+\.farsigh.security\.com\.$')
+_EXCH_RE = re.compile(r'exch\.fsi')
 
-def _gen_integration_test(cases):
-    def tc(self):
-        for i in range(len(cases)):
-            c = cases[i]
-            with self.subTest(i=i, case=c):
 
-                f = getattr(self.client, c.get('f'))
+def _run_integration_case(client: dnsdb2.Client, c):
+    f = getattr(client, c.get('f'))
 
-                exc = c.get('exc')
-                if not exc:
-                    o = f(*c.get('args', []), **c.get('kwargs', {}))
-                    if isinstance(o, Generator):
-                        res = list(o)
-                    else:
-                        res = o
-                else:
-                    with self.assertRaises(exc):
-                        res = list()
-                        for row in f(*c.get('args', []), **c.get('kwargs', {})):
-                            res.append(row)
+    exc = c.get('exc')
+    if not exc:
+        o = f(*c.get('args', []), **c.get('kwargs', {}))
+        if isinstance(o, Iterator):
+            res = list(o)
+        else:
+            res = o
+    else:
+        with pytest.raises(exc):
+            res = list()
+            for row in f(*c.get('args', []), **c.get('kwargs', {})):
+                res.append(row)
 
-                row_check = c.get('row_check')
-                if row_check:
-                    for row in res:
-                        self.assertTrue(row_check(row), str(row))
+    row_check = c.get('row_check')
+    if row_check:
+        for row in res:
+            assert row_check(row), str(row)
 
-                check = c.get('check')
-                if check:
-                    check(res)
-    return tc
+    check = c.get('check')
+    if check:
+        assert check(res), str(res)
 
 
 def check_aggr(res) -> bool:
@@ -59,303 +59,345 @@ def check_aggr(res) -> bool:
     after aggregation.
     """
     seen = set()
+    add = seen.add
     for row in res:
-        k = (row['rrname'], row['rrtype'], tuple(row['rdata']))
+        k = (row['rrname'], row['rrtype'], tuple(sorted(row['rdata'])))
         if k in seen:
             return True
-        seen.add(k)
+        add(k)
+    return False
 
 
-class TestIntegration(unittest.TestCase):
-    def setUp(self):
-        self.apikey = os.getenv('APIKEY')
-        self.server = os.getenv('DNSDB_SERVER', dnsdb2.DEFAULT_DNSDB_SERVER)
-        if not self.apikey:
-            self.skipTest('apikey undefined')
-        self.client = dnsdb2.Client(apikey=self.apikey, server=self.server)
+PING_CASES = tuple(map(MappingProxyType, [
+    {
+        'f': 'ping',
+        'check': lambda res: res
+    }
+]))
 
-    def tearDown(self) -> None:
-        self.client.close()
 
-    def test_bad_key(self):
-        c = dnsdb2.Client('invalid-key', server=self.server)
-        try:
-            self.assertRaises(dnsdb2.AccessDenied, c.rate_limit)
-        finally:
-            c.close()
+RATE_LIMIT_CASES = tuple(map(MappingProxyType, [
+    {
+        'f': 'rate_limit',
+        'check': lambda res: 'rate' in res
+    }
+]))
 
-    test_ping = _gen_integration_test([
-        {
-            'f': 'ping',
-            'check': lambda res: res
-        }
-    ])
 
-    def test_ping_empty_key(self):
-        c = dnsdb2.Client('', server=self.server)
-        try:
-            self.assertTrue(c.ping())
-        finally:
-            c.close()
+RRSET_CASES = tuple(map(MappingProxyType, [
+    {
+        'f': 'lookup_rrset',
+        'args': ['farsightsecurity.com'],
+        'row_check': lambda row: row['rrname'] == 'farsightsecurity.com.',
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rrset',
+        'args': ['farsightsecurity.com'],
+        'kwargs': {'rrtype': 'A'},
+        'row_check': lambda row: row['rrtype'] == 'A',
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rrset',
+        'args': ['farsightsecurity.com'],
+        'kwargs': {'bailiwick': 'com'},
+        'row_check': lambda row: row['bailiwick'] == 'com.',
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rrset',
+        'args': ['farsightsecurity.com'],
+        'kwargs': {'rrtype': 'NS', 'bailiwick': 'com'},
+        'row_check': lambda row: row['rrtype'] == 'NS' and row['bailiwick'] == 'com.',
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'summarize_rrset',
+        'args': ['farsightsecurity.com'],
+        'check': lambda res: len(res) == 1 and res[0]['count'] > 0,
+    },
+]))
 
-    def test_ping_bad_key(self):
-        c = dnsdb2.Client('invalid-key', server=self.server)
-        try:
-            self.assertTrue(c.ping())
-        finally:
-            c.close()
 
-    test_rate_limit = _gen_integration_test([
-        {
-            'f': 'rate_limit',
-            'check': lambda res: 'rate' in res
-        }
-    ])
-
-    test_rrset = _gen_integration_test([
-        {
-            'f': 'lookup_rrset',
-            'args': ['farsightsecurity.com'],
-            'row_check': lambda row: row['rrname'] == 'farsightsecurity.com.',
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'lookup_rrset',
-            'args': ['farsightsecurity.com'],
-            'kwargs': {'rrtype': 'A'},
-            'row_check': lambda row: row['rrtype'] == 'A',
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'lookup_rrset',
-            'args': ['farsightsecurity.com'],
-            'kwargs': {'bailiwick': 'com'},
-            'row_check': lambda row: row['bailiwick'] == 'com.',
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'lookup_rrset',
-            'args': ['farsightsecurity.com'],
-            'kwargs': {'rrtype': 'NS', 'bailiwick': 'com'},
-            'row_check': lambda row: row['rrtype'] == 'NS' and row['bailiwick'] == 'com.',
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'summarize_rrset',
-            'args': ['farsightsecurity.com'],
-            'check': lambda res: len(res) == 1 and res[0]['count'] > 0,
-        },
-    ])
-
-    test_rdata_name = _gen_integration_test([
-        {
-            'f': 'lookup_rdata_name',
-            'args': ['exch.fsi.io'],
-            'row_check': lambda res: len(list(filter(lambda rdata: rdata.endswith('exch.fsi.io.'), res['rdata']))) > 0,
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'lookup_rdata_name',
-            'args': ['exch.fsi.io'],
-            'kwargs': {'rrtype': 'MX'},
-            'row_check': lambda row: row['rrtype'] == 'MX',
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'summarize_rdata_name',
-            'args': ['exch.fsi.io'],
-            'check': lambda res: res[0]['count'] > 0,
-        },
-    ])
-
-    test_rdata_ip = _gen_integration_test([
-        {
-            'f': 'lookup_rdata_ip',
-            'args': ['104.244.14.95'],
-            'row_check': lambda res: len(list(filter(lambda rdata: rdata == '104.244.14.95', res['rdata']))) > 0,
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'lookup_rdata_ip',
-            'args': ['104.244.14.95'],
-            'kwargs': {'rrtype': 'A'},
-            'row_check': lambda row: row['rrtype'] == 'A',
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'lookup_rdata_ip',
-            'args': ['2620:11c:f008::95'],
-            'row_check': lambda res: len(list(filter(lambda rdata: rdata == '2620:11c:f008::95', res['rdata']))) > 0,
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'lookup_rdata_ip',
-            'args': ['2620:11c:f008::95'],
-            'kwargs': {'rrtype': 'A'},
-            'row_check': lambda row: row['rrtype'] == 'AAAA',
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'lookup_rdata_ip',
-            'args': ['104.244.14.95-104.244.14.96'],
-            'row_check': lambda res: len(list(filter(lambda rdata: rdata in ('104.244.14.95', '104.244.14.96'),
-                                                     res['rdata']))) > 0,
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'lookup_rdata_ip',
-            'args': ['104.244.14.0'],
-            'row_check': lambda res: len(list(filter(lambda rdata: rdata.startswith('104.244.14.'), res['rdata']))) > 0,
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'summarize_rdata_ip',
-            'args': ['104.244.14.95'],
-            'row_check': lambda res: res['count'] > 0,
-            'check': lambda res: len(res) == 1,
-        },
-    ])
-
-    test_rdata_raw = _gen_integration_test([
-        {
-            'f': 'lookup_rdata_raw',
-            'args': ['000A04657863680366736902696F00'],
-            'row_check': lambda res: len(list(filter(lambda rdata: rdata == '10 exch.fsi.io.', res['rdata']))) > 0,
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'lookup_rdata_raw',
-            'args': ['000A04657863680366736902696F00'],
-            'kwargs': {
-                'rrtype': 'MX',
-            },
-            'row_check': lambda res: res['rrtype'] == 'MX',
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'summarize_rdata_raw',
-            'args': ['000A04657863680366736902696F00'],
-            'row_check': lambda res: res['count'] > 0,
-            'check': lambda res: len(res) == 1,
-        },
-    ])
-
-    test_flex = _gen_integration_test([
-        {
-            'f': 'flex_rrnames_regex',
-            'args': [r'fa*rsight?security\.com\.$'],
-            'row_check': lambda res: re.search(r'fa*rsight?security\.com\.$', res['rrname']),
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'flex_rrnames_regex',
-            'args': [r'farsight?security\.com\.$'],
-            'kwargs': {
-                'rrtype': 'A',
-            },
-            'row_check': lambda res: res['rrtype'] == 'A',
-            'check': lambda res: len(res) > 0,
-        },
-        {
-            'f': 'flex_rrnames_glob',
-            'args': ['*.farsigh?security.com.'],
-            'row_check': lambda res: re.search(r'.+\.farsigh.security\.com\.$', res['rrname']),
-            'check': lambda res: len(res) > 0,
+RDATA_NAME_CASES = tuple(map(MappingProxyType, [
+    {
+        'f': 'lookup_rdata_name',
+        'args': ['exch.fsi.io'],
+        'row_check': lambda res: any(rdata.endswith('exch.fsi.io.') for rdata in res['rdata']),
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rdata_name',
+        'args': ['exch.fsi.io'],
+        'kwargs': {'rrtype': 'MX'},
+        'row_check': lambda row: row['rrtype'] == 'MX',
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'summarize_rdata_name',
+        'args': ['exch.fsi.io'],
+        'check': lambda res: res[0]['count'] > 0,
+    },
+]))
+
+
+RDATA_IP_CASES = tuple(map(MappingProxyType, [
+    {
+        'f': 'lookup_rdata_ip',
+        'args': ['104.244.14.95'],
+        'row_check': lambda res: '104.244.14.95' in res['rdata'],
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rdata_ip',
+        'args': ['104.244.14.95'],
+        'kwargs': {'rrtype': 'A'},
+        'row_check': lambda row: row['rrtype'] == 'A',
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rdata_ip',
+        'args': ['2620:11c:f008::95'],
+        'row_check': lambda res: '2620:11c:f008::95' in res['rdata'],
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rdata_ip',
+        'args': ['2620:11c:f008::95'],
+        'kwargs': {'rrtype': 'A'},
+        'row_check': lambda row: row['rrtype'] == 'AAAA',
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rdata_ip',
+        'args': ['104.244.14.95-104.244.14.96'],
+        'row_check': lambda res: any(rdata in ('104.244.14.95', '104.244.14.96') for rdata in res['rdata']),
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rdata_ip',
+        'args': ['104.244.14.0'],
+        'row_check': lambda res: any(rdata.startswith('104.244.14.') for rdata in res['rdata']),
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'summarize_rdata_ip',
+        'args': ['104.244.14.95'],
+        'row_check': lambda res: res['count'] > 0,
+        'check': lambda res: len(res) == 1,
+    },
+]))
+
+
+RDATA_RAW_CASES = tuple(map(MappingProxyType, [
+    {
+        'f': 'lookup_rdata_raw',
+        'args': ['000A04657863680366736902696F00'],
+        'row_check': lambda res: '10 exch.fsi.io.' in res['rdata'],
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rdata_raw',
+        'args': ['000A04657863680366736902696F00'],
+        'kwargs': {
+            'rrtype': 'MX',
         },
-        {
-            'f': 'flex_rdata_regex',
-            'args': [r'exch\.fsi'],
-            'row_check': lambda res: re.search(r'exch\.fsi', res['rdata']),
-            'check': lambda res: len(res) > 0,
+        'row_check': lambda res: res['rrtype'] == 'MX',
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'summarize_rdata_raw',
+        'args': ['000A04657863680366736902696F00'],
+        'row_check': lambda res: res['count'] > 0,
+        'check': lambda res: len(res) == 1,
+    },
+]))
+
+
+FLEX_CASES = tuple(map(MappingProxyType, [
+    {
+        'f': 'flex_rrnames_regex',
+        'args': [r'fa*rsight?security\.com\.$'],
+        'row_check': lambda res, p=_FARSIGHT_RE: p.search(res['rrname']),
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'flex_rrnames_regex',
+        'args': [r'farsight?security\.com\.$'],
+        'kwargs': {
+            'rrtype': 'A',
         },
-        {
-            'f': 'flex_rdata_glob',
-            'args': ['*exch.fsi*'],
-            'row_check': lambda res: re.search(r'exch\.fsi', res['rdata']),
-            'check': lambda res: len(res) > 0,
+        'row_check': lambda res: res['rrtype'] == 'A',
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'flex_rrnames_glob',
+        'args': ['*.farsigh?security.com.'],
+        'row_check': lambda res, p=_SUBDOMAIN_RE: p.search(res['rrname']),
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'flex_rdata_regex',
+        'args': [r'exch\.fsi'],
+        'row_check': lambda res, p=_EXCH_RE: p.search(res['rdata']),
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'flex_rdata_glob',
+        'args': ['*exch.fsi*'],
+        'row_check': lambda res, p=_EXCH_RE: p.search(res['rdata']),
+        'check': lambda res: len(res) > 0,
+    },
+]))
+
+
+KWARGS_CASES = tuple(map(MappingProxyType, [
+    {
+        'f': 'lookup_rrset',
+        'args': ['farsightsecurity.com'],
+        'kwargs': {
+            'time_first_before': -86400,
         },
-    ])
-
-    test_kwargs = _gen_integration_test([
-        {
-            'f': 'lookup_rrset',
-            'args': ['farsightsecurity.com'],
-            'kwargs': {
-                'time_first_before': -86400,
-            },
-            'row_check': lambda res: res.get('time_first', res.get('zone_time_first')) < time.time()-86340,
-            'check': lambda res: len(res) > 0,
+        'row_check': lambda res: res.get('time_first', res.get('zone_time_first')) < time.time()-86340,
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rrset',
+        'args': ['farsightsecurity.com'],
+        'kwargs': {
+            'time_first_after': -86400,
         },
-        {
-            'f': 'lookup_rrset',
-            'args': ['farsightsecurity.com'],
-            'kwargs': {
-                'time_first_after': -86400,
-            },
-            'row_check': lambda res: res.get('time_first', res.get('zone_time_first')) >= time.time() - 86460,
+        'row_check': lambda res: res.get('time_first', res.get('zone_time_first')) >= time.time() - 86460,
+    },
+    {
+        'f': 'lookup_rrset',
+        'args': ['farsightsecurity.com'],
+        'kwargs': {
+            'time_last_before': -86400,
         },
-        {
-            'f': 'lookup_rrset',
-            'args': ['farsightsecurity.com'],
-            'kwargs': {
-                'time_last_before': -86400,
-            },
-            'row_check': lambda res: res.get('time_last', res.get('zone_time_last')) < time.time() - 86340,
-            'check': lambda res: len(res) > 0,
+        'row_check': lambda res: res.get('time_last', res.get('zone_time_last')) < time.time() - 86340,
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rrset',
+        'args': ['farsightsecurity.com'],
+        'kwargs': {
+            'time_last_after': -86400,
         },
-        {
-            'f': 'lookup_rrset',
-            'args': ['farsightsecurity.com'],
-            'kwargs': {
-                'time_last_after': -86400,
-            },
-            'row_check': lambda res: res.get('time_last', res.get('zone_time_last')) >= time.time() - 86460,
+        'row_check': lambda res: res.get('time_last', res.get('zone_time_last')) >= time.time() - 86460,
+    },
+    {
+        'f': 'lookup_rrset',
+        'args': ['farsightsecurity.com'],
+        'kwargs': {
+            'limit': 5,
         },
-        {
-            'f': 'lookup_rrset',
-            'args': ['farsightsecurity.com'],
-            'kwargs': {
-                'limit': 5,
-            },
-            'row_check': lambda row: row['rrname'] == 'farsightsecurity.com.',
-            'check': lambda res: len(res) == 5,
-            'exc': dnsdb2.QueryLimited,
+        'row_check': lambda row: row['rrname'] == 'farsightsecurity.com.',
+        'check': lambda res: len(res) == 5,
+        'exc': dnsdb2.QueryLimited,
+    },
+    {
+        'f': 'lookup_rrset',
+        'args': ['farsightsecurity.com'],
+        'kwargs': {
+            'aggr': False,
         },
-        {
-            'f': 'lookup_rrset',
-            'args': ['farsightsecurity.com'],
-            'kwargs': {
-                'aggr': False,
-            },
-            'check': check_aggr,
+        'check': check_aggr,
+    },
+    {
+        'f': 'lookup_rrset',
+        'args': ['farsightsecurity.com'],
+        'kwargs': {
+            'humantime': True,
         },
-        {
-            'f': 'lookup_rrset',
-            'args': ['farsightsecurity.com'],
-            'kwargs': {
-                'humantime': True,
-            },
-            'row_check': lambda res: isinstance(res.get('time_first', res.get('zone_time_first')), str),
-            'check': lambda res: len(res) > 0,
+        'row_check': lambda res: isinstance(res.get('time_first', res.get('zone_time_first')), str),
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'lookup_rrset',
+        'args': ['farsightsecurity.com'],
+        'kwargs': {
+            'offset': 1,
         },
-        {
-            'f': 'lookup_rrset',
-            'args': ['farsightsecurity.com'],
-            'kwargs': {
-                'offset': 1,
-            },
-            'check': lambda res: len(res) > 0,
+        'check': lambda res: len(res) > 0,
+    },
+    {
+        'f': 'summarize_rrset',
+        'args': ['farsightsecurity.com'],
+        'kwargs': {
+            'max_count': 1,
         },
-        {
-            'f': 'summarize_rrset',
-            'args': ['farsightsecurity.com'],
-            'kwargs': {
-                'max_count': 1,
-            },
-            'check': lambda res: len(res) == 1,
-        }
-    ])
-
-
-if __name__ == '__main__':
-    unittest.main()
+        'check': lambda res: len(res) == 1,
+    }
+]))
+
+
+@pytest.fixture(scope='module')
+def server():
+    if not os.getenv('APIKEY'):
+        pytest.skip('apikey undefined')
+    return os.getenv('DNSDB_SERVER', dnsdb2.DEFAULT_DNSDB_SERVER)
+
+
+@pytest.fixture(scope='class')
+def client(server):
+    c = dnsdb2.Client(apikey=os.getenv('APIKEY'), server=server)
+    yield c
+    c.close()
+
+
+class TestIntegration:
+    def test_bad_key(self, server):
+        c = dnsdb2.Client('invalid-key', server=server)
+        try:
+            with pytest.raises(dnsdb2.AccessDenied):
+                c.rate_limit()
+        finally:
+            c.close()
+
+    @pytest.mark.parametrize('case', PING_CASES)
+    def test_ping(self, client, case):
+        _run_integration_case(client, case)
+
+    def test_ping_empty_key(self, server):
+        c = dnsdb2.Client('', server=server)
+        try:
+            assert c.ping()
+        finally:
+            c.close()
+
+    def test_ping_bad_key(self, server):
+        c = dnsdb2.Client('invalid-key', server=server)
+        try:
+            assert c.ping()
+        finally:
+            c.close()
+
+    @pytest.mark.parametrize('case', RATE_LIMIT_CASES)
+    def test_rate_limit(self, client, case):
+        _run_integration_case(client, case)
+
+    @pytest.mark.parametrize('case', RRSET_CASES)
+    def test_rrset(self, client, case):
+        _run_integration_case(client, case)
+
+    @pytest.mark.parametrize('case', RDATA_NAME_CASES)
+    def test_rdata_name(self, client, case):
+        _run_integration_case(client, case)
+
+    @pytest.mark.parametrize('case', RDATA_IP_CASES)
+    def test_rdata_ip(self, client, case):
+        _run_integration_case(client, case)
+
+    @pytest.mark.parametrize('case', RDATA_RAW_CASES)
+    def test_rdata_raw(self, client, case):
+        _run_integration_case(client, case)
+
+    @pytest.mark.parametrize('case', FLEX_CASES)
+    def test_flex(self, client, case):
+        _run_integration_case(client, case)
+
+    @pytest.mark.parametrize('case', KWARGS_CASES)
+    def test_kwargs(self, client, case):
+        _run_integration_case(client, case)
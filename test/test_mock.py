@@ -0,0 +1,99 @@
+# Copyright (c) 2020 by Farsight Security, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+import dnsdb2
+import dnsdb2.mock
+
+RESULT_A = ({'rrname': 'a.example.'},)
+RESULT_B = ({'rrname': 'b.example.'}, {'rrname': 'c.example.'})
+
+
+class TestSearchResults:
+    def test_results_in_order(self):
+        client = dnsdb2.mock.Client(search_results=[RESULT_A, RESULT_B])
+        assert RESULT_A == client.lookup_rrset('a.example')
+        assert [RESULT_B] == client.search_results, 'remaining results'
+        assert RESULT_B == client.flex_rrnames_glob('*.example.')
+        assert [] == client.search_results, 'remaining results'
+
+    def test_assign(self):
+        client = dnsdb2.mock.Client()
+        assert [] == client.search_results
+        client.search_results = [RESULT_A]
+        assert RESULT_A == client.summarize_rdata_ip('1.2.3.4')
+
+    def test_limited(self):
+        client = dnsdb2.mock.Client(search_results=[dnsdb2.mock.limited(RESULT_B)])
+        actual = []
+        with pytest.raises(dnsdb2.QueryLimited):
+            for res in client.lookup_rdata_name('example'):
+                actual.append(res)
+        assert list(RESULT_B) == actual
+
+    def test_exception_result(self):
+        e = dnsdb2.QueryFailed('failed')
+        client = dnsdb2.mock.Client(search_results=[e, RESULT_A])
+        with pytest.raises(dnsdb2.QueryFailed):
+            client.lookup_rrset('a.example')
+        assert RESULT_A == client.lookup_rrset('a.example')
+
+    def test_exhausted(self):
+        client = dnsdb2.mock.Client(search_results=[RESULT_A])
+        client.lookup_rrset('a.example')
+        with pytest.raises(IndexError, match='search_results exhausted'):
+            client.lookup_rrset('a.example')
+
+
+class TestCalls:
+    def test_result_recorded(self):
+        client = dnsdb2.mock.Client(ping_result=True, rate_limit_result={'rate': {}}, search_results=[RESULT_A])
+        assert client.ping()
+        assert {'rate': {}} == client.rate_limit()
+        assert RESULT_A == client.lookup_rrset('a.example', rrtype='A', limit=1)
+        assert [
+            {'f': 'ping', 'args': (), 'kwargs': {}, 'res': True},
+            {'f': 'rate_limit', 'args': (), 'kwargs': {}, 'res': {'rate': {}}},
+            {'f': 'lookup_rrset', 'args': ('a.example',), 'kwargs': {'rrtype': 'A', 'limit': 1}, 'res': RESULT_A},
+        ] == client.calls
+
+    def test_exception_result_recorded(self):
+        e = dnsdb2.QueryFailed('failed')
+        client = dnsdb2.mock.Client(search_results=[e])
+        with pytest.raises(dnsdb2.QueryFailed):
+            client.flex_rdata_regex('example')
+        assert [{'f': 'flex_rdata_regex', 'args': ('example',), 'kwargs': {}, 'e': e}] == client.calls
+
+    def test_exhausted_recorded(self):
+        client = dnsdb2.mock.Client()
+        with pytest.raises(IndexError):
+            client.lookup_rdata_raw('abcd')
+        assert isinstance(client.calls[0]['e'], IndexError)
+        assert 'res' not in client.calls[0]
+
+    @pytest.mark.parametrize('f,args', [
+        ('ping', ()),
+        ('rate_limit', ()),
+        ('lookup_rrset', ('a.example',)),
+        ('summarize_rdata_name', ('a.example',)),
+    ])
+    def test_exception(self, f, args):
+        e = dnsdb2.AccessDenied('denied')
+        client = dnsdb2.mock.Client(exception=e, ping_result=True, search_results=[RESULT_A])
+        with pytest.raises(dnsdb2.AccessDenied):
+            getattr(client, f)(*args)
+        assert [{'f': f, 'args': args, 'kwargs': {}, 'e': e}] == client.calls
+        # The exception is raised before a search result is consumed.
+        assert [RESULT_A] == client.search_results
@@ -13,116 +13,131 @@
 # limitations under the License.
 
 
-import json
 import textwrap
 from typing import Iterable, Collection, Type
-import unittest
 
-import requests_mock
+try:
+    import orjson as json
+except ImportError:
+    import json
+
+import pytest
 
 import dnsdb2
 import dnsdb2.saf
 
-class TestSafHandler(unittest.TestCase):
+SIMPLE_MSGS = tuple(textwrap.dedent('''\
+    {"cond": "begin"}
+    {"obj": {"count": 10392, "time_first": 138126549}}
+    {"cond": "succeeded"}
+''').splitlines())
+
+SIMPLE_ONGOING_MSGS = tuple(textwrap.dedent('''\
+    {"cond": "begin"}
+    {"cond": "ongoing", "obj": {"count": 10392, "time_first": 138126549}}
+    {"cond": "succeeded"}
+''').splitlines())
+
+SIMPLE_EXPECTED = (json.loads('{"count":10392,"time_first":138126549}'),)
+
+LIMITED_MSGS = tuple(textwrap.dedent('''\
+    {"cond": "begin"}
+    {"obj":{"count":10392,"time_first":138126549}}
+    {"cond": "limited", "msg": "Query limit reached", "obj":{"count":33,"time_first":19126549}}
+''').splitlines())
+
+LIMITED_EXPECTED = tuple(json.loads(s) for s in textwrap.dedent('''\
+    {"count":10392,"time_first":138126549}
+    {"count":33,"time_first":19126549}
+''').splitlines())
+
+FAILURE_MSGS = tuple(textwrap.dedent('''\
+    {"cond": "begin"}
+    {"cond": "failed", "msg": "Processing timeout; results may be incomplete", "obj":{"count":33,"time_first":19126549}}
+''').splitlines())  # nopep8
+
+FAILURE_EXPECTED = tuple(json.loads(s) for s in textwrap.dedent('''\
+    {"count":33,"time_first":19126549}
+''').splitlines())
+
+TRUNCATED_MSGS = tuple(textwrap.dedent('''\
+    {"cond": "begin"}
+    {"cond": "ongoing", "obj": {"count": 10392, "time_first": 138126549}}
+''').splitlines())
+
+
+class _StubResponse:
+    """
+    Stands in for a requests.Response whose body is msgs joined by newlines,
+    or is read in the given chunks.
+    """
+    def __init__(self, msgs: Iterable[str] = (), chunks: Iterable[bytes] = None, status_code: int = 200):
+        self._msgs = msgs
+        self._chunks = chunks
+        self.status_code = status_code
+        self.closed = False
+
+    def iter_content(self, chunk_size: int, decode_unicode: bool = False):
+        assert not decode_unicode
+        if self._chunks is not None:
+            return list(self._chunks)
+        return ['\n'.join(self._msgs).encode('utf-8')]
+
+    def close(self):
+        self.closed = True
+
+
+def run_test(msgs: Iterable[str], expected: Collection[dict], e: Type[BaseException] = None,
+             ignore_limited: bool = False):
+    res = _StubResponse(msgs)
+    if not e:
+        actual = list(dnsdb2.saf.handle_saf(res, ignore_limited=ignore_limited))
+    else:
+        actual = []
+        with pytest.raises(e):
+            for msg in dnsdb2.saf.handle_saf(res, ignore_limited=ignore_limited):
+                actual.append(msg)
+    assert list(expected) == actual
+    assert res.closed, "Connection was closed"
+
+
+class TestSafHandler:
     def test_simple(self):
-        self.run_test(
-            textwrap.dedent('''\
-                {"cond": "begin"}
-                {"obj": {"count": 10392, "time_first": 138126549}}
-                {"cond": "succeeded"}
-            ''').split('\n'),
-            ['{"count":10392,"time_first":138126549}']
-        )
+        run_test(SIMPLE_MSGS, SIMPLE_EXPECTED)
 
     def test_simple_ongoing(self):
-        self.run_test(
-            textwrap.dedent('''\
-                {"cond": "begin"}
-                {"cond": "ongoing", "obj": {"count": 10392, "time_first": 138126549}}
-                {"cond": "succeeded"}
-            ''').split('\n'),
-            ['{"count":10392,"time_first":138126549}']
-        )
+        run_test(SIMPLE_ONGOING_MSGS, SIMPLE_EXPECTED)
 
     def test_limited(self):
-        self.run_test(
-            textwrap.dedent('''\
-                {"cond": "begin"}
-                {"obj":{"count":10392,"time_first":138126549}}
-                {"cond": "limited", "msg": "Query limit reached", "obj":{"count":33,"time_first":19126549}}
-            ''').split('\n'),
-            textwrap.dedent('''\
-                {"count":10392,"time_first":138126549}
-                {"count":33,"time_first":19126549}
-            ''').split('\n'),
-            e=dnsdb2.QueryLimited
-        )
+        run_test(LIMITED_MSGS, LIMITED_EXPECTED, e=dnsdb2.QueryLimited)
 
     def test_ignore_limited(self):
-        self.run_test(
-            textwrap.dedent('''\
-                {"cond": "begin"}
-                {"obj":{"count":10392,"time_first":138126549}}
-                {"cond": "limited", "msg": "Query limit reached", "obj":{"count":33,"time_first":19126549}}
-            ''').split('\n'),
-            textwrap.dedent('''\
-                {"count":10392,"time_first":138126549}
-                {"count":33,"time_first":19126549}
-            ''').split('\n'),
-            ignore_limited=True,
-        )
+        run_test(LIMITED_MSGS, LIMITED_EXPECTED, ignore_limited=True)
 
     def test_failure(self):
-        self.run_test(
-            textwrap.dedent('''\
-                {"cond": "begin"}
-                {"cond": "failed", "msg": "Processing timeout; results may be incomplete", "obj":{"count":33,"time_first":19126549}}
-            ''').split('\n'),  # nopep8
-            textwrap.dedent('''\
-                {"count":33,"time_first":19126549}
-            ''').split('\n'),
-            e=dnsdb2.QueryFailed
-        )
+        run_test(FAILURE_MSGS, FAILURE_EXPECTED, e=dnsdb2.QueryFailed)
 
     def test_truncated(self):
-        self.run_test(
-            textwrap.dedent('''\
-                {"cond": "begin"}
-                {"cond": "ongoing", "obj": {"count": 10392, "time_first": 138126549}}
-            ''').split('\n'),
-            ['{"count":10392,"time_first":138126549}'],
-            e=dnsdb2.QueryTruncated
-        )
+        run_test(TRUNCATED_MSGS, SIMPLE_EXPECTED, e=dnsdb2.QueryTruncated)
 
     def test_invalid_cond(self):
-        self.run_test(['{"cond": "invalid"}'], [], e=dnsdb2.ProtocolError)
+        run_test(['{"cond": "invalid"}'], [], e=dnsdb2.ProtocolError)
 
     def test_broken_json(self):
-        self.run_test(['{"cond": '], [], e=dnsdb2.ProtocolError)
-
-    def run_test(self, msgs: Iterable[str], expected: Collection[str], e: Type[BaseException] = None,
-                 ignore_limited: bool = False):
-        class Response:
-            def __init__(self):
-                self.closed = False
-            def iter_lines(_, decode_unicode: bool):
-                self.assertTrue(decode_unicode)
-                return msgs
-            def close(self):
-                self.closed = True
-
-        res = Response()
-        if not e:
-            actual = list(dnsdb2.saf.handle_saf(res, ignore_limited=ignore_limited))
-        else:
-            actual = []
-
-            def f():
-                for msg in dnsdb2.saf.handle_saf(res, ignore_limited=ignore_limited):
-                    actual.append(msg)
-            self.assertRaises(e, f)
-        self.assertEqual([json.loads(s) for s in filter(lambda x: x, expected)], actual)
-        self.assertTrue(res.closed, "Connection was closed")
-
-if __name__ == '__main__':
-    unittest.main()
+        run_test(['{"cond": '], [], e=dnsdb2.ProtocolError)
+
+    def test_broken_json_message(self):
+        with pytest.raises(dnsdb2.ProtocolError, match='could not decode json: {"cond": $'):
+            list(dnsdb2.saf.handle_saf(_StubResponse(['{"cond": '])))
+
+    def test_close(self):
+        res = _StubResponse(['{"cond": "begin"}', '{"obj": 1}', '{"obj": 2}'])
+        with dnsdb2.saf.handle_saf(res) as it:
+            assert 1 == next(it)
+        assert res.closed, "Connection was closed"
+        with pytest.raises(StopIteration):
+            next(it)
+
+    def test_split_chunks(self):
+        res = _StubResponse(chunks=[b'{"cond": "be', b'gin"}\n\n{"obj": 1}\n{"obj"', b': 2}'])
+        assert [b'{"cond": "begin"}', b'{"obj": 1}', b'{"obj": 2}'] == list(dnsdb2.saf._iter_ndjson(res))